@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the per-pixel color conversion: cto8b() + Color() versus
+# the lookup tables of ColorConverter.pack()
+
+import os, sys, timeit, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_led
+from worker_led import cto8b, Color, ColorConverter, hsv
+
+def main():
+    n = 10000
+    random.seed(0)
+    samples = {
+        'float': [hsv(random.random(), 1, 1) for _ in range(n)],
+        'constant': [worker_led.colors['orange']] * n,
+        '#rrggbb': ['#%06x' % random.randrange(1 << 24) for _ in range(n)],
+        }
+    conv = ColorConverter(2.2, worker_led.brightness)
+    for name, colors in samples.items():
+        assert [conv.pack(c) for c in colors[:100]] == \
+                [Color(*cto8b(c)) for c in colors[:100]]
+        t_old = min(timeit.repeat(lambda: [Color(*cto8b(c)) for c in colors],
+            number=1, repeat=5))
+        t_new = min(timeit.repeat(lambda: [conv.pack(c) for c in colors],
+            number=1, repeat=5))
+        print(f'{name:>10}: cto8b+Color {t_old / n * 1e9:6.0f} ns/pixel, '
+              f'ColorConverter {t_new / n * 1e9:6.0f} ns/pixel, '
+              f'speedup {t_old / t_new:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Benchmark of all the effects of effect_library on a fake LED string: frames
+# per second, 99th percentile of the frame time and peak memory allocated by
+# Python, for several LED string lengths. Results are written as JSON, and
+# can be compared to previous results to find regressions:
+#
+#   benchmarks/bench_effects.py -o before.json
+#   ... change things ...
+#   benchmarks/bench_effects.py -o after.json
+#   benchmarks/bench_effects.py --compare before.json after.json
+
+import os, sys, time, json, random, platform, argparse, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_led as w
+
+def bench(effect, n, seconds, max_frames):
+    # frame times of the effect, as rendered and sent by the led driver
+    random.seed(0)
+    st = w.PixelString(n, 18, False)
+    st.start(effect, 0, w.fx_load(n, effect))
+    if st.fx_mod is None:
+        raise Exception(f'failed to load effect {effect}')
+    # replaying the cached cycle of a periodic effect would hide the cost of
+    # rendering it, which must still be sustainable during the first cycle
+    st.loop = None
+    times = []
+    end = time.perf_counter() + seconds
+    while len(times) < max_frames and (len(times) < 10 or
+            time.perf_counter() < end):
+        t = time.perf_counter()
+        w.render_one_frame([st])
+        times.append(time.perf_counter() - t)
+    return times
+
+def peak_memory(effect, n, nr_frames=10):
+    # peak memory allocated while loading the effect and rendering a few
+    # frames; measured separately as tracemalloc slows Python down a lot
+    tracemalloc.start()
+    try:
+        bench(effect, n, 0, nr_frames)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run(args):
+    # stdout is for the results
+    w.log = lambda m: None
+    w.PixelStrip = None
+    w.gpiozero = None
+    w.colorconv = w.ColorConverter(2.2, w.brightness)
+    w.colorcache = w.ColorCache(w.colorconv)
+    effects = args.effects or [x[:-3] for x in sorted(os.listdir(w.pkg_path))
+            if x.endswith('.py')]
+    results = {}
+    for effect in effects:
+        results[effect] = {}
+        for n in args.sizes:
+            try:
+                times = sorted(bench(effect, n, args.seconds, args.frames))
+                r = {
+                    'fps': len(times) / sum(times),
+                    'p99_ms': times[min(len(times) - 1,
+                        int(.99 * len(times)))] * 1e3,
+                    'peak_kb': peak_memory(effect, n) / 1024,
+                    }
+            except Exception as e:
+                r = { 'error': str(e) }
+            results[effect][n] = r
+            print(f'{effect:30} {n:5} pixels: ' + ('error: ' + r['error']
+                if 'error' in r else f'{r["fps"]:8.1f} fps, p99 '
+                f'{r["p99_ms"]:7.2f} ms, peak {r["peak_kb"]:8.0f} KiB'),
+                file=sys.stderr)
+    out = {
+        'python': sys.version.split()[0],
+        'machine': platform.machine(),
+        'numpy': w.np is not None,
+        'results': results,
+        }
+    dat = json.dumps(out, indent=2)
+    if args.output:
+        open(args.output, 'w').write(dat + '\n')
+    else:
+        print(dat)
+
+def compare(old_file, new_file, threshold):
+    # Returns the number of regressions: fps lower, or p99 frame time or peak
+    # memory higher, by more than threshold %
+    old = json.load(open(old_file))['results']
+    new = json.load(open(new_file))['results']
+    regressions = 0
+    for effect in sorted(set(old) & set(new)):
+        for n in old[effect]:
+            a, b = old[effect][n], new[effect].get(n)
+            if b is None or 'error' in a:
+                continue
+            if 'error' in b:
+                print(f'{effect} {n} pixels: error: {b["error"]}')
+                regressions += 1
+                continue
+            for key, worse in (('fps', -1), ('p99_ms', 1), ('peak_kb', 1)):
+                change = (b[key] - a[key]) / a[key] * 100 if a[key] else 0
+                if change * worse > threshold:
+                    print(f'{effect} {n} pixels: {key} {a[key]:.4g} -> '
+                          f'{b[key]:.4g} ({change:+.0f}%)')
+                    regressions += 1
+    print(f'{regressions} regression(s) over {threshold}%')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('effects', nargs='*',
+            help='effects to benchmark (default: all)')
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+            default=[60, 300, 1000, 5000], help='numbers of pixels')
+    parser.add_argument('-s', '--seconds', type=float, default=2,
+            help='max time to benchmark an effect at each size')
+    parser.add_argument('-f', '--frames', type=int, default=300,
+            help='max frames to render at each size')
+    parser.add_argument('-o', '--output', help='JSON file (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+            help='compare 2 result files instead of benchmarking')
+    parser.add_argument('-t', '--threshold', type=float, default=10,
+            help='regression threshold in %% for --compare')
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# Load test of the web server: simulated clients polling /get/state, like the
+# web interface does every 500 ms, over keep-alive connections. Reports the
+# latency of the requests, and the frame timing of the led driver without
+# and with the load, which should not change. Runs against a server already
+# rendering an effect, for example:
+#
+#   ./ledthemfight.py -p 8080 &
+#   curl -H 'Content-Type: application/json' -d '{"name":"effect","value":"Rainbow"}' localhost:8080/button
+#   benchmarks/bench_http.py -u http://localhost:8080
+
+import sys, time, json, argparse, threading, http.client, urllib.parse
+
+def get(conn, path):
+    conn.request('GET', path)
+    resp = conn.getresponse()
+    dat = resp.read()
+    if resp.status != 200:
+        raise Exception(f'{path}: HTTP {resp.status}')
+    return json.loads(dat)
+
+def client(url, interval, end, latencies, errors):
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    while time.monotonic() < end:
+        t = time.monotonic()
+        try:
+            get(conn, '/get/state')
+            latencies.append(time.monotonic() - t)
+        except Exception:
+            errors.append(1)
+            conn.close()
+        time.sleep(max(0, interval - (time.monotonic() - t)))
+    conn.close()
+
+def frame_timing(url, seconds):
+    # frame timing of the led driver over seconds: fps, missed deadlines,
+    # 99th percentile of the render time (see the stats of the led driver)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    missed = get(conn, '/get/stats')['missed_deadlines']
+    fps = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        time.sleep(1)
+        fps.append(get(conn, '/get/state')['fps'])
+    st = get(conn, '/get/stats')
+    conn.close()
+    render = st['stages'].get('render_frames', {})
+    return {
+        'fps': sum(fps) / len(fps),
+        'missed_deadlines': st['missed_deadlines'] - missed,
+        'render_p99_ms': render.get('p99', 0),
+        }
+
+def pct(r, p):
+    return r[min(len(r) - 1, int(p * len(r)))] * 1e3 if r else 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--url', default='http://localhost:80')
+    parser.add_argument('-c', '--clients', type=int, default=20)
+    parser.add_argument('-i', '--interval', type=float, default=.5,
+            help='time between the requests of a client, 0 for no pause')
+    parser.add_argument('-s', '--seconds', type=float, default=15,
+            help='duration of each phase')
+    args = parser.parse_args()
+    url = urllib.parse.urlsplit(args.url)
+    if not get(http.client.HTTPConnection(url.hostname, url.port or 80),
+            '/get/state')['rendering'][0]:
+        sys.exit('the server is not rendering any effect')
+    print(f'without load:  {frame_timing(url, args.seconds)}')
+    latencies, errors = [], []
+    end = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=client,
+            args=(url, args.interval, end, latencies, errors))
+            for _ in range(args.clients)]
+    for th in threads:
+        th.start()
+    timing = frame_timing(url, args.seconds)
+    for th in threads:
+        th.join()
+    print(f'with {args.clients} clients: {timing}')
+    r = sorted(latencies)
+    print(f'{len(r) / args.seconds:.0f} requests/s, {len(errors)} errors, '
+          f'latency p50 {pct(r, .5):.1f} ms, p95 {pct(r, .95):.1f} ms, '
+          f'p99 {pct(r, .99):.1f} ms, max {pct(r, 1):.1f} ms')
+
+if __name__ == '__main__':
+    main()
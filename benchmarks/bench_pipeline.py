@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# Benchmark of the render/transmit pipeline: frames/sec when rendering then
+# transmitting each frame sequentially, versus rendering the next frame while
+# the FrameTransmitter thread sends the current one. Runs on the fake LED
+# string, simulating a transmit time of 30 µs per pixel.
+
+import os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_led as w
+
+def run(strings, pipelined, nr_frames=60):
+    t = time.monotonic()
+    for _ in range(nr_frames):
+        if pipelined:
+            w.transmitter.submit(w.render_frames(strings))
+        else:
+            w.render_one_frame(strings)
+    w.transmitter.drain()
+    return nr_frames / (time.monotonic() - t)
+
+def main():
+    sys.setswitchinterval(1e-3)
+    w.PixelStrip = None
+    w.FakePixelStrip.transmit_time = 30e-6
+    w.colorconv = w.ColorConverter(2.2, w.brightness)
+    w.colorcache = w.ColorCache(w.colorconv)
+    w.transmitter = w.FrameTransmitter()
+    effect = sys.argv[1] if len(sys.argv) > 1 else 'Rainbow'
+    for n in (300, 1000):
+        st = w.PixelString(n, 18, False)
+        st.start(effect, 0, w.fx_load(n, effect))
+        w.stats = w.Stats()
+        seq = run([st], False)
+        render = w.stats.mean('render_frames')
+        # not the show_frames stage: frames identical to the previous one
+        # are not sent
+        transmit = w.stats.mean('upload') + w.stats.mean('show')
+        pip = run([st], True)
+        print(f'{effect} {n:5} pixels: render {render * 1e3:5.1f} ms, '
+              f'transmit {transmit * 1e3:5.1f} ms, '
+              f'sequential {seq:5.1f} fps, pipelined {pip:5.1f} fps')
+
+if __name__ == '__main__':
+    main()
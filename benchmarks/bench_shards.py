@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# Benchmark of sharded rendering: frames/sec of a PURE effect rendered by the
+# led driver process itself, then by 1 to 4 render_shard processes
+
+import os, sys, time, array
+from multiprocessing import Process, Pipe
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_led as w
+
+def fps(render, nr_frames=30):
+    render(0)
+    t = time.monotonic()
+    for frame in range(1, nr_frames + 1):
+        render(frame)
+    return nr_frames / (time.monotonic() - t)
+
+def main():
+    effect = sys.argv[1] if len(sys.argv) > 1 else 'Rainbow'
+    conns = []
+    for i in range(4):
+        conn, child_conn = Pipe()
+        Process(target=w.shard_forever, args=(child_conn,), daemon=True).start()
+        conns.append(conn)
+    conv = w.ColorConverter(2.2, w.brightness)
+    cache = w.ColorCache(conv)
+    print(f'{effect}, frames/sec ({os.cpu_count()} CPU cores)')
+    print(f'{"pixels":>7} {"single":>8}' +
+          ''.join(f'{str(k) + " shards":>10}' for k in range(1, 5)))
+    for n in (300, 1000, 5000):
+        m = w.fx_load(n, effect)
+        out = [None] * n
+        line = f'{n:7} {fps(lambda f: array.array("I", cache.pack_frame(w.render_colors(m, n, f, out)))):8.1f}'
+        for k in range(1, 5):
+            sr = w.ShardedRenderer(conns[:k], n, effect)
+            line += f'{fps(lambda f: sr.render(f, f / 60, w.brightness)):10.1f}'
+            sr.close()
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# Benchmark of sending a frame to the LED string: one setPixelColor() call per
+# pixel versus PixelString.show_frame(). Uses the real LED string when run on a
+# Raspberry Pi (as root), or the fake one otherwise.
+
+import os, sys, timeit, array
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_led
+
+def per_pixel(st, buf):
+    for i, v in enumerate(buf):
+        phys_i = i if not st.inverted else st.num_pixels - 1 - i
+        st.ps.setPixelColor(phys_i, v)
+    st.ps.show()
+
+def show_frame(st, buf):
+    # show_frame() does not send a frame identical to the last one sent
+    st.last = None
+    st.show_frame(buf)
+
+def main():
+    for n in (60, 300, 1500, 5000):
+        st = worker_led.PixelString(n, 18, True)
+        buf = array.array('I', range(n))
+        t_old = min(timeit.repeat(lambda: per_pixel(st, buf), number=10,
+            repeat=5)) / 10
+        t_new = min(timeit.repeat(lambda: show_frame(st, buf), number=10,
+            repeat=5)) / 10
+        print(f'{n:5} pixels: setPixelColor {t_old * 1e3:7.3f} ms/frame, '
+              f'show_frame {t_new * 1e3:7.3f} ms/frame, '
+              f'speedup {t_old / t_new:.1f}x')
+        st.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Compile an effect module into a compiled show, pre-rendered for the LED
+# string, to be played by the led driver with:
+# curl http://HOST/button --json '{"name":"show","value":"NAME"}'
+
+import argparse, json, os, sys, time
+import worker_led
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('effect', help='name of the effect module')
+    parser.add_argument('-n', '--num-pixels', type=int,
+            help='default: as configured in /etc/ledthemfight.conf')
+    parser.add_argument('-s', '--seconds', type=float, default=60)
+    parser.add_argument('--fps', type=int,
+            help='default: the FPS declared by the effect, or 60')
+    parser.add_argument('-b', '--brightness', type=int, default=128)
+    parser.add_argument('-g', '--gamma', type=float, default=2.2)
+    parser.add_argument('--no-compress', action='store_true')
+    parser.add_argument('-o', '--output',
+            help='default: shows/EFFECT.show, to be played as "EFFECT"')
+    args = parser.parse_args()
+    worker_led.proc_name = 'compile_show'
+    if args.num_pixels is None:
+        try:
+            args.num_pixels = json.load(open('/etc/ledthemfight.conf'))['num_pixels']
+        except (FileNotFoundError, KeyError):
+            sys.exit('error: the number of pixels is not configured, '
+                     'use --num-pixels')
+    if args.fps is None:
+        m = worker_led.fx_load(args.num_pixels, args.effect)
+        args.fps = getattr(m, 'FPS', worker_led.fps_goal)
+    if args.output is None:
+        os.makedirs(worker_led.show_path, exist_ok=True)
+        args.output = f'{worker_led.show_path}/{args.effect}.show'
+    n_frames = round(args.seconds * args.fps)
+    if args.fps < 1 or n_frames < 1:
+        sys.exit(f'error: {args.seconds} s at {args.fps} fps is less than 1 '
+                 'frame')
+    t = time.monotonic()
+    worker_led.compile_show(args.output, args.effect, args.num_pixels,
+            args.fps, n_frames, max(1, min(255, args.brightness)), args.gamma,
+            not args.no_compress)
+    print(f'{args.output}: {n_frames} frames of {args.num_pixels} pixels at '
+          f'{args.fps} fps, {os.path.getsize(args.output)} bytes, compiled '
+          f'in {time.monotonic() - t:.1f} s')
+
+if __name__ == '__main__':
+    main()
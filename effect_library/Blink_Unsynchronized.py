@@ -1,6 +1,7 @@
 from random import randint, seed
 
 period = 120 # nr. of frames that each pixel blinks one color then the other
+PERIOD = period
 every = 3 # only light up 1 out of <every> pixel
 
 def render(index, frame):
@@ -1,6 +1,13 @@
+# a slow breathing animation does not need to be rendered at 60 fps
+FPS = 30
+# the frames repeat every 2 seconds, which is not a fixed number of frames
+# when the target fps is lower than FPS, so let the period be detected
+PERIOD = True
+
 def render(index, frame):
-    p = 120 
-    frac = (frame % p) / p
+    # computed from t rather than frame so the LED string, the preview and
+    # compiled shows breathe at the same speed whatever their fps
+    frac = (t % 2) / 2
     if frac <= .5:
         c = frac / .5
     else:
@@ -8,6 +8,9 @@ def before_frame(frame):
     global color_i
     color_i = 1 + int((frame * speed) / num_pixels)
 
-def render(index, frame):
-    i = color_i if index < ((frame * speed) % num_pixels) else color_i - 1
-    return colors[i % len(colors)]
+def render_frame(frame, out):
+    # pixels before the wipe position show the new color, the others still
+    # show the previous one
+    w = (frame * speed) % num_pixels
+    out[:w] = [colors[color_i % len(colors)]] * w
+    out[w:] = [colors[(color_i - 1) % len(colors)]] * (num_pixels - w)
@@ -1,4 +1,5 @@
 clen = max(10, int(num_pixels / 15))
+PERIOD = 5 * clen
 
 def render(index, frame):
     intens = ((index + int(-frame / 5)) % clen + 1) / clen
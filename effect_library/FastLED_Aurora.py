@@ -5,9 +5,10 @@ Slow, ethereal waves of green and purple
 
 import math
 
+KEYFRAME_FPS = 20
+
 def render(index, frame):
     # Multiple slow sine waves create aurora effect
-    t = frame / 60.0
     x = index / num_pixels
     
     # Base wave (primary green)
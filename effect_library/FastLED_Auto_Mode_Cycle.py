@@ -7,24 +7,24 @@ Each mode runs for 5 seconds before switching to the next
 import math
 
 # Configuration
-MODE_DURATION = 300  # frames (5 seconds at 60fps)
+MODE_DURATION = 5  # seconds
 NUM_MODES = 8
 
 # State
 current_mode = 0
-mode_start_frame = 0
+mode_start_time = 0
 
 def before_frame(frame):
-    global current_mode, mode_start_frame
+    global current_mode, mode_start_time
     
     # Check if it's time to switch modes
-    if frame - mode_start_frame >= MODE_DURATION:
+    if t - mode_start_time >= MODE_DURATION:
         current_mode = (current_mode + 1) % NUM_MODES
-        mode_start_frame = frame
+        mode_start_time = t
 
 def render(index, frame):
-    # Calculate local frame time within current mode
-    local_frame = frame - mode_start_frame
+    # Calculate local time within current mode, in 60ths of a second
+    local_frame = round((t - mode_start_time) * 60)
     
     if current_mode == 0:
         # Mode 0: Static solid blue
@@ -133,12 +133,13 @@ def colorFromPalette(palette, index, brightness=255, blend='linear'):
 
 def before_frame(frame):
     """Update animation state and palette changes"""
-    # Advance the starting position (animation speed)
-    state['start_index'] = (state['start_index'] + 1) % 256
+    # Advance the starting position (animation speed), 60 steps per second
+    state['start_index'] = round(t * 60) % 256
     
     # Change palette periodically
-    seconds = frame // 60
-    if seconds % SECONDS_PER_PALETTE == 0 and frame % 60 == 0:
+    palette_period = int(t // SECONDS_PER_PALETTE)
+    if palette_period != state.get('palette_period'):
+        state['palette_period'] = palette_period
         state['current_palette_index'] = (state['current_palette_index'] + 1) % (len(PALETTES) + 1)
         
         # Generate new random palette when cycling back
@@ -16,8 +16,8 @@ TEMPERATURES = {
     'clear_blue_sky': {'r': 0.70, 'g': 0.85, 'b': 1.0},
 }
 
-DISPLAY_TIME = 600  # Frames to display each temperature (10 seconds)
-BLACK_TIME = 180    # Frames of black between switches (3 seconds)
+DISPLAY_TIME = 10  # Seconds to display each temperature
+BLACK_TIME = 3     # Seconds of black between switches
 
 current_temp = 'tungsten'
 next_temp = 'overcast'
@@ -26,7 +26,7 @@ def before_frame(frame):
     global current_temp, next_temp
     
     # Calculate which period we're in
-    period = (frame // DISPLAY_TIME) % 2
+    period = int(t // DISPLAY_TIME) % 2
     
     if period == 0:
         current_temp = 'tungsten'
@@ -40,8 +40,7 @@ def render(index, frame):
         return rgb(temp['r'], temp['g'], temp['b'])
     
     # Black out during transition
-    local_frame = frame % DISPLAY_TIME
-    if local_frame < BLACK_TIME:
+    if t % DISPLAY_TIME < BLACK_TIME:
         return black
     
     # Show rainbow with current color temperature applied
@@ -50,7 +49,8 @@ def render(index, frame):
         return black
     
     # Generate rainbow
-    hue = ((frame // 3) + (index - 5) * 20) % 360
+    # 20 degrees per second
+    hue = (int(t * 20) + (index - 5) * 20) % 360
     base_color = hsv(hue / 360.0, 1, 1)
     
     # Apply color temperature correction
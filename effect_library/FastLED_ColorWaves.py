@@ -6,6 +6,8 @@ Shows smooth color transitions using palette blending
 
 import math
 
+RESOLUTION = max(1, num_pixels // 1000)
+
 # Different color palettes to cycle through
 PALETTES = {
     'rainbow': lambda i: hsv(i % 1.0, 1, 1),
@@ -17,12 +19,14 @@ PALETTES = {
 
 current_palette = 'rainbow'
 palette_index = 0
+palette_period = None
 
 def before_frame(frame):
-    global current_palette, palette_index
+    global current_palette, palette_index, palette_period
     
     # Change palette every 5 seconds
-    if frame % 300 == 0:
+    if int(t // 5) != palette_period:
+        palette_period = int(t // 5)
         palette_names = list(PALETTES.keys())
         palette_index = (palette_index + 1) % len(palette_names)
         current_palette = palette_names[palette_index]
@@ -32,8 +36,8 @@ def render(index, frame):
     palette_func = PALETTES[current_palette]
     
     # Multiple wave speeds for interesting patterns
-    wave1 = frame / 200.0
-    wave2 = frame / 333.0
+    wave1 = t * 60 / 200.0
+    wave2 = t * 60 / 333.0
     
     # Blend position in palette based on pixel index and waves
     palette_pos = (index / num_pixels + wave1 + math.sin(wave2 * 2 * math.pi) * 0.3) % 1.0
@@ -9,31 +9,37 @@ All LEDs cycle through the rainbow colors
 position = 0
 direction = 1
 fade_buffer = {}
+# number of moves of the scanner, one at the first frame then one every
+# 60th of a second
+steps = 0
 
 def before_frame(frame):
-    global position, direction
+    global position, direction, steps
     
-    # Move the position
-    position += direction
-    
-    # Bounce at the ends
-    if position >= num_pixels:
-        position = num_pixels - 1
-        direction = -1
-    elif position < 0:
-        position = 0
-        direction = 1
+    # Move the position by one pixel every 60th of a second
+    n = round(t * 60) + 1 - steps
+    steps += n
+    for _ in range(n):
+        position += direction
+        
+        # Bounce at the ends
+        if position >= num_pixels:
+            position = num_pixels - 1
+            direction = -1
+        elif position < 0:
+            position = 0
+            direction = 1
     
     # Fade all pixels
     for i in range(num_pixels):
         if i in fade_buffer:
-            fade_buffer[i] *= 0.98  # nscale8(250) ≈ 250/255
+            fade_buffer[i] *= 0.98 ** n  # nscale8(250) ≈ 250/255
             if fade_buffer[i] < 0.01:
                 del fade_buffer[i]
 
 def render(index, frame):
     # Calculate hue that continuously cycles
-    hue = (frame / 2) % 360  # Changes every 2 frames
+    hue = (t * 30) % 360  # 30 degrees per second
     
     if index == position:
         # Set the current position to full brightness
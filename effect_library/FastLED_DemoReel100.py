@@ -8,28 +8,26 @@ import math
 import random
 
 # Configuration
-PATTERN_DURATION = 600  # frames (10 seconds at 60fps)
+PATTERN_DURATION = 10  # seconds
 NUM_PATTERNS = 6
 
 # State
 current_pattern = 0
-pattern_start_frame = 0
+pattern_start_time = 0
 g_hue = 0  # rotating base color
 
 def before_frame(frame):
-    global current_pattern, pattern_start_frame, g_hue
+    global current_pattern, pattern_start_time, g_hue
     
     # Slowly cycle the base color through the rainbow
-    g_hue = (frame * 20 / 60) % 360  # Increment every 20ms equivalent
+    g_hue = (t * 20) % 360  # 20 degrees per second
     
     # Check if it's time to switch patterns
-    if frame - pattern_start_frame >= PATTERN_DURATION:
+    if t - pattern_start_time >= PATTERN_DURATION:
         current_pattern = (current_pattern + 1) % NUM_PATTERNS
-        pattern_start_frame = frame
+        pattern_start_time = t
 
 def render(index, frame):
-    local_frame = frame - pattern_start_frame
-    
     if current_pattern == 0:
         return rainbow(index)
     elif current_pattern == 1:
@@ -101,7 +99,7 @@ def sinelon(index, frame):
     
     # Calculate position of the dot using beatsin
     # beatsin16(13, 0, NUM_LEDS-1)
-    beat_pos = (math.sin((frame * 13 / 60) * 2 * math.pi) + 1) / 2
+    beat_pos = (math.sin((t * 13) * 2 * math.pi) + 1) / 2
     pos = int(beat_pos * (num_pixels - 1))
     
     if index == pos:
@@ -117,7 +115,7 @@ def sinelon(index, frame):
 def bpm(index, frame):
     beats_per_minute = 62
     # beatsin8(BeatsPerMinute, 64, 255)
-    beat = (math.sin((frame * beats_per_minute / 60 / 60) * 2 * math.pi) + 1) / 2
+    beat = (math.sin((t * beats_per_minute / 60) * 2 * math.pi) + 1) / 2
     beat = beat * (191 / 255) + (64 / 255)  # scale to 64-255 range
     
     # Use PartyColors-like palette (cycling through rainbow)
@@ -144,7 +142,7 @@ def juggle(index, frame):
     dot_hue = 0
     for i in range(8):
         # beatsin16(i+7, 0, NUM_LEDS-1)
-        beat_pos = (math.sin((frame * (i + 7) / 60) * 2 * math.pi) + 1) / 2
+        beat_pos = (math.sin((t * (i + 7)) * 2 * math.pi) + 1) / 2
         pos = int(beat_pos * (num_pixels - 1))
         
         if index == pos:
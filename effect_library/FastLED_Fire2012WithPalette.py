@@ -34,18 +34,18 @@ PALETTES = {
 # State
 heat = []
 current_palette = 'normal'
-palette_change_frame = 0
+palette_change_time = 0
 
 def before_frame(frame):
-    global heat, current_palette, palette_change_frame
+    global heat, current_palette, palette_change_time
     
     # Initialize heat array on first frame
     if len(heat) != num_pixels:
         heat = [0] * num_pixels
     
     # Change palette every 10 seconds
-    if frame - palette_change_frame > 600:
-        palette_change_frame = frame
+    if t - palette_change_time > 10:
+        palette_change_time = t
         palette_names = list(PALETTES.keys())
         current_idx = palette_names.index(current_palette)
         current_palette = palette_names[(current_idx + 1) % len(palette_names)]
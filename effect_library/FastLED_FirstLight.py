@@ -7,18 +7,18 @@ Translated from FastLED FirstLight example.
 
 Parameters (edit at top of file):
 - DOT_COLOR: Color of the moving dot
-- DELAY_FRAMES: Frames to wait between moves (6 = 0.1 seconds at 60fps)
+- MOVES_PER_SECOND: Speed of the dot
 """
 
 # Configuration
 DOT_COLOR = (255, 255, 255)  # White
-DELAY_FRAMES = 6  # About 100ms at 60fps
+MOVES_PER_SECOND = 10  # One move every 100ms
 
 
 def render(index, frame):
     """Render one pixel"""
     # Calculate position of moving dot
-    position = (frame // DELAY_FRAMES) % num_pixels
+    position = int(t * MOVES_PER_SECOND) % num_pixels
     
     if index == position:
         return rgb(*DOT_COLOR)
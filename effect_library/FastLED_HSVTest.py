@@ -12,7 +12,8 @@ Translated from FastLED HSVTest example.
 
 Parameters (edit at top of file):
 - MODE: 'hue_cycle', 'saturation_demo', 'value_demo', or 'all'
-- SPEED: Animation speed (1-10, higher = faster)
+- SPEED: Animation speed (1-10, higher = faster, in hue steps per 60th of
+  a second)
 """
 
 # Configuration
@@ -25,7 +26,7 @@ def render(index, frame):
     
     if MODE == 'hue_cycle':
         # Cycle through all hues at full saturation and value
-        hue = ((frame * SPEED) % 256) / 255.0
+        hue = ((round(t * 60) * SPEED) % 256) / 255.0
         return hsv(hue, 1.0, 1.0)
     
     elif MODE == 'saturation_demo':
@@ -46,7 +47,7 @@ def render(index, frame):
         
         if index < section:
             # Section 1: Hue cycle
-            hue = ((frame * SPEED + index * 10) % 256) / 255.0
+            hue = ((round(t * 60) * SPEED + index * 10) % 256) / 255.0
             return hsv(hue, 1.0, 1.0)
         elif index < section * 2:
             # Section 2: Saturation gradient
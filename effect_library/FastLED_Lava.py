@@ -6,13 +6,15 @@ Creates organic, slow-moving blobs of color
 import math
 import random
 
+KEYFRAME_FPS = 15
+
 # Lava blob parameters
 NUM_BLOBS = 4
 
 class Blob:
     def __init__(self):
         self.center = random.random() * 100
-        self.speed = random.uniform(-0.3, 0.3)
+        self.speed = random.uniform(-0.3, 0.3) * 60  # pixels per second
         self.size = random.uniform(3, 8)
         self.hue = random.uniform(0, 0.15)  # Red-orange range
 
@@ -29,7 +31,7 @@ def before_frame(frame):
     
     # Move blobs
     for blob in blobs:
-        blob.center += blob.speed
+        blob.center += blob.speed * dt
         
         # Wrap around
         if blob.center > num_pixels + 10:
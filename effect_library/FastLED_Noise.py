@@ -6,8 +6,10 @@ Creates organic, flowing patterns using procedural noise
 
 import math
 
+KEYFRAME_FPS = 20
+
 # Noise parameters
-SPEED = 20      # Speed of noise movement (1=very slow, 100=very fast)
+SPEED = 20      # Speed of noise movement per 1/60 s (1=very slow, 100=very fast)
 SCALE = 311     # Scale of noise (lower=zoomed in, higher=zoomed out)
 
 # Noise state
@@ -35,7 +37,7 @@ def simple_perlin_noise(x, y, z):
 def before_frame(frame):
     global noise_z
     # Move through the noise space over time
-    noise_z += SPEED
+    noise_z += SPEED * dt * 60
 
 def render(index, frame):
     # Calculate noise coordinates for this pixel
@@ -6,6 +6,9 @@ Inspired by the waters off the southern coast of California
 
 import math
 
+# slow waves: render 15 frames per second, the ones in between are blended
+KEYFRAME_FPS = 15
+
 # Color palettes - three custom blue-green palettes
 # Each palette has 16 colors in RGB format
 PALETTE_1 = [
@@ -34,26 +37,25 @@ s_ci_start1 = 0
 s_ci_start2 = 0
 s_ci_start3 = 0
 s_ci_start4 = 0
-s_last_frame = 0
 
 # Buffer to accumulate wave layers
 wave_buffer = {}
 
-def beatsin16(bpm, low, high, frame):
+def beatsin16(bpm, low, high, t):
     """Approximation of FastLED's beatsin16 function"""
-    beats = frame * bpm / 60 / 60  # Convert frame to beats
+    beats = t * bpm / 60  # Convert seconds to beats
     sine_val = (math.sin(beats * 2 * math.pi) + 1) / 2
     return int(low + sine_val * (high - low))
 
-def beatsin8(bpm, low, high, frame):
+def beatsin8(bpm, low, high, t):
     """8-bit version of beatsin"""
-    beats = frame * bpm / 60 / 60
+    beats = t * bpm / 60
     sine_val = (math.sin(beats * 2 * math.pi) + 1) / 2
     return int(low + sine_val * (high - low))
 
-def beatsin88(bpm, low, high, frame):
+def beatsin88(bpm, low, high, t):
     """88-bit fixed point approximation"""
-    beats = frame * bpm / 60 / 60
+    beats = t * bpm / 60
     sine_val = (math.sin(beats * 2 * math.pi) + 1) / 2
     return low + sine_val * (high - low)
 
@@ -75,24 +77,22 @@ def get_palette_color(palette, index, brightness):
     return (color[0] / 255.0 * bri, color[1] / 255.0 * bri, color[2] / 255.0 * bri)
 
 def before_frame(frame):
-    global s_ci_start1, s_ci_start2, s_ci_start3, s_ci_start4, s_last_frame, wave_buffer
+    global s_ci_start1, s_ci_start2, s_ci_start3, s_ci_start4, wave_buffer
     
-    # Calculate delta time
-    delta_frames = frame - s_last_frame
-    s_last_frame = frame
-    deltams = delta_frames * 16.67  # Approximate milliseconds
+    # Delta time since the previous frame
+    deltams = dt * 1000
     
     # Update wave counters with varying speeds
-    speedfactor1 = beatsin16(3, 179, 269, frame)
-    speedfactor2 = beatsin16(4, 179, 269, frame)
+    speedfactor1 = beatsin16(3, 179, 269, t)
+    speedfactor2 = beatsin16(4, 179, 269, t)
     deltams1 = (deltams * speedfactor1) / 256
     deltams2 = (deltams * speedfactor2) / 256
     deltams21 = (deltams1 + deltams2) / 2
     
-    s_ci_start1 += int(deltams1 * beatsin88(1011, 10, 13, frame))
-    s_ci_start2 -= int(deltams21 * beatsin88(777, 8, 11, frame))
-    s_ci_start3 -= int(deltams1 * beatsin88(501, 5, 7, frame))
-    s_ci_start4 -= int(deltams2 * beatsin88(257, 4, 6, frame))
+    s_ci_start1 += int(deltams1 * beatsin88(1011, 10, 13, t))
+    s_ci_start2 -= int(deltams21 * beatsin88(777, 8, 11, t))
+    s_ci_start3 -= int(deltams1 * beatsin88(501, 5, 7, t))
+    s_ci_start4 -= int(deltams2 * beatsin88(257, 4, 6, t))
     
     # Keep values in reasonable range
     s_ci_start1 = s_ci_start1 % 65536
@@ -104,17 +104,17 @@ def before_frame(frame):
     wave_buffer = {i: [2/255, 6/255, 10/255] for i in range(num_pixels)}
     
     # Render four wave layers with different parameters
-    add_wave_layer(PALETTE_1, s_ci_start1, beatsin16(3, 11 * 256, 14 * 256, frame), 
-                   beatsin8(10, 70, 130, frame), -beatsin16(301, 0, 65535, frame), frame)
-    add_wave_layer(PALETTE_2, s_ci_start2, beatsin16(4, 6 * 256, 9 * 256, frame),
-                   beatsin8(17, 40, 80, frame), beatsin16(401, 0, 65535, frame), frame)
+    add_wave_layer(PALETTE_1, s_ci_start1, beatsin16(3, 11 * 256, 14 * 256, t), 
+                   beatsin8(10, 70, 130, t), -beatsin16(301, 0, 65535, t), frame)
+    add_wave_layer(PALETTE_2, s_ci_start2, beatsin16(4, 6 * 256, 9 * 256, t),
+                   beatsin8(17, 40, 80, t), beatsin16(401, 0, 65535, t), frame)
     add_wave_layer(PALETTE_3, s_ci_start3, 6 * 256,
-                   beatsin8(9, 10, 38, frame), -beatsin16(503, 0, 65535, frame), frame)
+                   beatsin8(9, 10, 38, t), -beatsin16(503, 0, 65535, t), frame)
     add_wave_layer(PALETTE_3, s_ci_start4, 5 * 256,
-                   beatsin8(8, 10, 28, frame), beatsin16(601, 0, 65535, frame), frame)
+                   beatsin8(8, 10, 28, t), beatsin16(601, 0, 65535, t), frame)
     
     # Add whitecaps where waves line up
-    add_whitecaps(frame)
+    add_whitecaps(t)
 
 def add_wave_layer(palette, cistart, wavescale, bri, ioff, frame):
     """Add one layer of waves into the buffer"""
@@ -143,12 +143,12 @@ def add_wave_layer(palette, cistart, wavescale, bri, ioff, frame):
         wave_buffer[i][1] = min(1.0, wave_buffer[i][1] + c[1])
         wave_buffer[i][2] = min(1.0, wave_buffer[i][2] + c[2])
 
-def add_whitecaps(frame):
+def add_whitecaps(t):
     """Add extra 'white' to areas where waves line up brightly"""
     global wave_buffer
     
-    basethreshold = beatsin8(9, 55, 65, frame)
-    wave = beatsin8(7, 0, 255, frame)
+    basethreshold = beatsin8(9, 55, 65, t)
+    wave = beatsin8(7, 0, 255, t)
     
     for i in range(num_pixels):
         threshold = int(math.sin(wave / 255.0 * math.pi) * 20) + basethreshold
@@ -4,11 +4,17 @@ Creates organic, flowing color patterns
 """
 
 import math
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PURE = True
+RESOLUTION = max(1, num_pixels // 1000)
 
 def render(index, frame):
     # Multiple sine waves at different frequencies create plasma effect
     x = index / num_pixels
-    t = frame / 60.0
     
     # Layer multiple sine waves
     v1 = math.sin(x * 10 + t)
@@ -23,3 +29,17 @@ def render(index, frame):
     hue = (plasma + 1) / 2  # Normalize to 0-1
     
     return hsv(hue, 1, 1)
+
+if np is not None:
+    # Same effect computed for all the pixels at once with NumPy
+    xs = np.arange(num_pixels) / num_pixels
+
+    def render_frame(frame, out):
+        v1 = np.sin(xs * 10 + t)
+        v2 = np.sin(10 * (xs * math.sin(t / 2) + t / 3))
+        v3 = np.sin(xs * 3 + t * 2)
+        v4 = np.sin(np.sqrt((xs - 0.5) ** 2) * 20 + t)
+        h6 = (v1 + v2 + v3 + v4 + 4) / 8 * 6
+        # hsv(hue, 1, 1) for an array of hues
+        return np.clip(np.stack((np.abs(h6 - 3) - 1, 2 - np.abs(h6 - 2),
+            2 - np.abs(h6 - 4)), axis=1), 0, 1)
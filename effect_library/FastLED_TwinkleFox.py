@@ -195,8 +195,9 @@ def computeOneTwinkle(ms, salt):
 def before_frame(frame):
     """Update palette transitions"""
     # Change palette periodically
-    palette_seconds = frame // 60
-    if palette_seconds % SECONDS_PER_PALETTE == 0 and frame % 60 == 0:
+    palette_period = int(t // SECONDS_PER_PALETTE)
+    if palette_period != state.get('palette_period'):
+        state['palette_period'] = palette_period
         # Switch to next palette
         state['current_palette_index'] = (state['current_palette_index'] + 1) % len(PALETTE_NAMES)
         state['target_palette'] = PALETTES[PALETTE_NAMES[state['current_palette_index']]]
@@ -229,7 +230,7 @@ def before_frame(frame):
 def render(index, frame):
     """Render one pixel with twinkling effect"""
     # PRNG for this pixel (consistent per pixel, varies per frame)
-    PRNG16 = (11337 + index * 2053 + (frame // 4)) & 0xFFFF
+    PRNG16 = (11337 + index * 2053 + int(t * 15)) & 0xFFFF
     
     # Generate random clock offset and speed for this pixel
     PRNG16 = ((PRNG16 * 2053) + 1384) & 0xFFFF
@@ -239,7 +240,7 @@ def render(index, frame):
     myspeedmultiplierQ5_3 = ((((PRNG16 & 0xFF) >> 4) + (PRNG16 & 0x0F)) & 0x0F) + 0x08
     
     # Calculate this pixel's adjusted clock
-    clock32 = (frame * 1000) // 60  # Convert frame to pseudo-milliseconds
+    clock32 = int(t * 1000)  # Convert seconds to milliseconds
     myclock30 = ((clock32 * myspeedmultiplierQ5_3) >> 3) + myclockoffset16
     myunique8 = (PRNG16 >> 8) & 0xFF
     
@@ -1,3 +1,5 @@
+STATIC = True
+
 def render(index, frame):
     if index < num_pixels / 3:
         return blue
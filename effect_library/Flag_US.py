@@ -1,5 +1,8 @@
 import random
 
+# hard edges: do not interpolate pixels
+RESOLUTION = 1
+
 state = {}
 
 def sparkling_star(i_star, dist_star):
@@ -16,6 +16,6 @@ def before_frame(frame):
     for i in range(bins):
         pixels[i] *= .95
 
-def render(index, frame):
-    v = pixels[int(index * bins / num_pixels)]
-    return rgb(v, 0, 0)
+def render_frame(frame, out):
+    c = [rgb(v, 0, 0) for v in pixels]
+    out[:] = [c[int(i * bins / num_pixels)] for i in range(num_pixels)]
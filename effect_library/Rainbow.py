@@ -1,2 +1,8 @@
+PURE = True
+# frames repeat every num_pixels frames, or 2 * num_pixels if it is odd
+PERIOD = 2 * num_pixels
+# on long LED strings, only render every N-th pixel and interpolate the others
+RESOLUTION = max(1, num_pixels // 1000)
+
 def render(index, frame):
     return hsv((2 * (index - int(frame / 2))) % num_pixels / num_pixels, 1, 1)
@@ -1,2 +1,4 @@
+STATIC = True
+
 def render(index, frame):
     return blue
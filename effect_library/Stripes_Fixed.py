@@ -1,3 +1,5 @@
+STATIC = True
+
 def render(index, frame):
     n = max(1, num_pixels / 20)
     return white if int(index / n) % 2 else red
@@ -1,3 +1,5 @@
+PURE = True
+
 def render(index, frame):
     n = max(4, round(num_pixels / 20))
     colors = [purple] * n + [black] * 2 \
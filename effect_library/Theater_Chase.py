@@ -1,4 +1,9 @@
+PURE = True
+# hard edges: do not interpolate pixels
+RESOLUTION = 1
+
 spacing = max(4, round(num_pixels / 75))
+PERIOD = 5 * spacing
 
 def render(index, frame):
     return black if ((index + int(-frame / 5)) % spacing) else white
@@ -1,5 +1,8 @@
 import math
 
+PURE = True
+RESOLUTION = max(1, num_pixels // 1000)
+
 colors = (cyan, blue)
 segs = max(2, round(num_pixels / 30))
 period = 100 # period of oscillations (in nr. of frames)
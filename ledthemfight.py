@@ -1,13 +1,277 @@
 #!/usr/bin/env python3
 
-import argparse, sys, os, json, urllib.parse, signal
-from multiprocessing import Process, Queue
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import argparse, sys, os, json, urllib.parse, signal, ctypes, struct, time, threading, itertools, collections, gzip, email.utils
+import multiprocessing
+from multiprocessing import Process, Queue, Pipe, Value, shared_memory
+from http.server import HTTPServer, ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+class ControlChannel:
+    # Messages to the led driver, which checks for new ones before every frame.
+    # Instead of Queue.empty(), which takes a lock and makes a syscall, it
+    # compares a counter of sent messages, in shared memory and read without
+    # the lock, to the number of messages it received: nothing is locked and
+    # there is no syscall as long as there is no new message. The counter is
+    # incremented before the message is put in the queue, so receiving the
+    # counted messages may have to wait for the sender to finish putting them,
+    # but never for long.
+    # Settings sent many times in a row, like the brightness while its slider
+    # is being dragged, are coalesced: only the last one of each kind received
+    # at once is applied.
+    coalesced = ('brightness', 'fps', 'fps_policy', 'governor')
+
+    def __init__(self):
+        self.queue = Queue()
+        self.sent = Value(ctypes.c_uint)
+        self.received = 0
+
+    def put(self, msg):
+        with self.sent.get_lock():
+            self.sent.value += 1
+        self.queue.put(msg)
+
+    def pending(self):
+        # number of messages sent but not received yet (the counter wraps)
+        return (self.sent.get_obj().value - self.received) & 0xffffffff
+
+    def get(self):
+        # Returns the pending messages, waiting for one if there is none. Only
+        # one process may receive messages.
+        n = max(1, self.pending())
+        msgs = [self.queue.get() for i in range(n)]
+        self.received = (self.received + n) & 0xffffffff
+        last = {}
+        for i, (action, arg) in enumerate(msgs):
+            if action == '/button' and arg[0] in self.coalesced:
+                last[arg[0]] = i
+        return [(action, arg) for i, (action, arg) in enumerate(msgs)
+                if not (action == '/button' and arg[0] in self.coalesced)
+                or last[arg[0]] == i]
+
+class StatusBlock:
+    # Status of the led driver, published by it in shared memory as JSON, so
+    # the web server can read it without a round-trip through the queues,
+    # which would have to wait for the led driver to be done with its current
+    # frame. The led driver is the only writer, and the block is protected by
+    # a seqlock: the sequence number is odd while the block is being written,
+    # and readers retry if it is odd or if it changed while they were reading.
+    # Header: sequence number, length of the JSON data, and a flag set by the
+    # readers when they want the lazy keys, which are costly to compute, so
+    # only published when wanted (see publish_status() in worker_led.py).
+    # The JSON data maps keys, eg. '/state', to [time.monotonic(), value].
+    size = 64 * 1024
+    header = struct.Struct('III')
+    lazy = ('/stats',)
+
+    def __init__(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=self.size)
+        self.shm.buf[:self.header.size] = bytes(self.header.size)
+        self.seq = 0
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def write(self, obj):
+        dat = json.dumps(obj).encode()
+        if self.header.size + len(dat) > self.size:
+            raise Exception(f'status too large: {len(dat)} bytes')
+        buf = self.shm.buf
+        self.seq = (self.seq + 1) & 0xffffffff
+        struct.pack_into('I', buf, 0, self.seq)
+        buf[self.header.size:self.header.size + len(dat)] = dat
+        struct.pack_into('I', buf, 4, len(dat))
+        self.seq = (self.seq + 1) & 0xffffffff
+        struct.pack_into('I', buf, 0, self.seq)
+
+    def read(self):
+        # Returns the last object written, or None if there is none or if the
+        # writer takes too long (eg. it died while writing)
+        buf = self.shm.buf
+        for i in range(100):
+            seq, n, _ = self.header.unpack_from(buf)
+            if seq == 0:
+                return None
+            if not seq & 1:
+                dat = bytes(buf[self.header.size:self.header.size + n])
+                if struct.unpack_from('I', buf)[0] == seq:
+                    try:
+                        return json.loads(dat)
+                    except ValueError:
+                        # Python has no memory barriers, so on a weakly
+                        # ordered CPU (ARM) the data may still be torn
+                        pass
+            time.sleep(1e-4)
+        return None
+
+    def get(self, key, max_age):
+        # Returns the value of key if it was published less than max_age
+        # seconds ago, otherwise None
+        if key in self.lazy:
+            struct.pack_into('I', self.shm.buf, 8, 1)
+        dat = self.read()
+        if not dat or key not in dat:
+            return None
+        t, val = dat[key]
+        return val if time.monotonic() - t <= max_age else None
+
+    def wanted(self):
+        # Returns whether the lazy keys were asked for since the last call
+        buf = self.shm.buf
+        w = struct.unpack_from('I', buf, 8)[0]
+        if w:
+            struct.pack_into('I', buf, 8, 0)
+        return bool(w)
+
+class LedDriverRPC:
+    # Calls to the led driver from the threads of the web server. Every call
+    # has an id, which the led driver sends back with its reply, so a thread
+    # routing the replies to_web_server (see dispatch()) can hand each one
+    # to the call waiting for it. A call gives up after timeout seconds, and
+    # its reply, if it ever comes, is dropped. At most max_calls calls may be
+    # in flight, to not flood the led driver.
+    def __init__(self, to_led_driver, to_web_server, max_calls=8):
+        self.to_led_driver = to_led_driver
+        self.to_web_server = to_web_server
+        self.slots = threading.BoundedSemaphore(max_calls)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # call id -> [threading.Event, reply]
+        self.calls = {}
+
+    def start(self):
+        threading.Thread(target=self.dispatch, name='rpc', daemon=True).start()
+
+    def dispatch(self):
+        while True:
+            call_id, key, val = self.to_web_server.get()
+            with self.lock:
+                call = self.calls.pop(call_id, None)
+            if call:
+                call[1] = [key, val]
+                call[0].set()
+
+    def call(self, action, arg, timeout=5):
+        # Returns the reply of the led driver, [key, val], key being 'error'
+        # if the call failed
+        if not self.slots.acquire(timeout=timeout):
+            return ['error', 'too many calls to the led driver']
+        try:
+            call = [threading.Event(), None]
+            with self.lock:
+                call_id = next(self.ids)
+                self.calls[call_id] = call
+            self.to_led_driver.put([action, (call_id, arg)])
+            if call[0].wait(timeout):
+                return call[1]
+            with self.lock:
+                self.calls.pop(call_id, None)
+            return call[1] or ['error', f'timed out after {timeout} s']
+        finally:
+            self.slots.release()
+
+class AssetCache:
+    # Static files of the web interface, kept in memory with a gzip-compressed
+    # copy when it is at least 10% smaller, so serving them does not read the
+    # SD card. Entries are keyed by file path, and are only valid while the
+    # file has the same mtime and size, so edited files are read again. The
+    # least recently used entries are evicted beyond max_bytes. Shared by the
+    # threads of the web server.
+    Asset = collections.namedtuple('Asset', 'key data gz etag mtime')
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nr_bytes = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        # raises OSError if the file cannot be read
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            a = self.entries.get(path)
+            if a and a.key == key:
+                self.entries.move_to_end(path)
+                return a
+        data = open(path, 'rb').read()
+        gz = gzip.compress(data, mtime=0)
+        if len(gz) > .9 * len(data):
+            gz = None
+        a = self.Asset(key, data, gz, f'"{key[0]:x}-{key[1]:x}"', st.st_mtime)
+        st = os.stat(path)
+        if (st.st_mtime_ns, st.st_size) != key or len(data) != key[1]:
+            # the file is being written (eg. a sequence by the seqgen)
+            return a
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old:
+                self.nr_bytes -= self.size(old)
+            self.entries[path] = a
+            self.nr_bytes += self.size(a)
+            while self.nr_bytes > self.max_bytes:
+                self.nr_bytes -= self.size(self.entries.popitem(last=False)[1])
+        return a
+
+    @staticmethod
+    def size(a):
+        return len(a.data) + (len(a.gz) if a.gz else 0)
+
+assets = AssetCache()
+
+seq_path = 'www/sequence'
+# versions of the sequence files, see sequence_versions()
+seq_versions = {}
+seq_versions_time = 0
+
+def sequence_versions():
+    # Versions (mtimes) of the sequence files written by the seqgen, by effect
+    # name, listed at most once a second: they are reported in /get/state so
+    # the web interface knows when there are new previews to fetch
+    global seq_versions, seq_versions_time
+    now = time.monotonic()
+    if now - seq_versions_time >= 1:
+        versions = {}
+        try:
+            with os.scandir(seq_path) as it:
+                for e in it:
+                    if e.name.endswith('.bin'):
+                        versions[e.name[:-4]] = e.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        seq_versions, seq_versions_time = versions, now
+    return seq_versions
+
+# same as pkg_path and show_path in worker_led.py
+fx_path = 'effect_library'
+show_path = 'shows'
+# lists of the effects and compiled shows, see effect_lists()
+fx_lists = {}
+fx_lists_time = 0
+
+def effect_lists():
+    # Names of the effect modules and of the compiled shows, listed at most
+    # once a second, like sequence_versions(): they are reported in /get/state
+    global fx_lists, fx_lists_time
+    now = time.monotonic()
+    if now - fx_lists_time >= 1:
+        lists = {}
+        for key, path, ext in (('effects', fx_path, '.py'),
+                ('shows', show_path, '.show')):
+            try:
+                lists[key] = [x[:-len(ext)] for x in sorted(os.listdir(path))
+                        if x.endswith(ext)]
+            except FileNotFoundError:
+                lists[key] = []
+        fx_lists, fx_lists_time = lists, now
+    return fx_lists
 
 conf_file = '/etc/ledthemfight.conf'
 conf = None
-to_led_driver = Queue()
+to_led_driver = ControlChannel()
 to_web_server = Queue()
+rpc = LedDriverRPC(to_led_driver, to_web_server)
+# created by main()
+status = None
 
 def conf_save():
     dat = json.dumps(conf, indent=2)
@@ -17,11 +281,25 @@ def conf_push():
     to_led_driver.put(['/initial_setup', conf])
 
 class MyHandler(SimpleHTTPRequestHandler):
-    # set a short timeout since Python's http.server basic implementation
-    # is not threaded and only accepts 1 blocking client at a time
+    # set a short timeout: with the single-threaded server only 1 blocking
+    # client is served at a time, and with the threaded one it is the time
+    # after which an idle keep-alive connection is closed, freeing its slot
     # (note: the timeout is implemented by StreamRequestHandler, parent
     # of BaseHTTPRequestHandler, parent of SimpleHTTPRequestHandler)
     timeout = 5
+    # the headers and the body of responses are sent separately, so without
+    # TCP_NODELAY the body of a response on a keep-alive connection waits for
+    # the client to acknowledge the headers (delayed ACK: ~40 ms)
+    disable_nagle_algorithm = True
+    # max time to render frames of an effect when profiling it, and to wait
+    # for the profiling process (which also has to start and load the
+    # effect), see profile()
+    profile_seconds = 45
+    profile_timeout = 60
+    # only one effect is profiled at a time
+    profile_lock = threading.Lock()
+    # max age of the status published by the led driver, see get_data()
+    status_max_age = 2
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory='www', **kwargs)
@@ -46,31 +324,164 @@ class MyHandler(SimpleHTTPRequestHandler):
         dat = self.rfile.read(cl).decode()
         return json.loads(dat)
 
-    def write_data(self, data):
-        self.wfile.write(data.encode())
+    def send_data(self, data):
+        # HTTP/1.1 keep-alive requires a Content-Length in every response
+        dat = data.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', len(dat))
+        self.end_headers()
+        self.wfile.write(dat)
 
-    def get_data(self, data):
-        to_led_driver.put(['/get', data])
-        key, val = to_web_server.get()
-        if key == '/state':
-            resp = val
+    def accepts_gzip(self):
+        for enc in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = enc.partition(';')
+            if name.strip() == 'gzip':
+                try:
+                    return float(params.partition('q=')[2] or 1) > 0
+                except ValueError:
+                    return False
+        return False
+
+    def send_asset(self):
+        # serve a static file from the AssetCache, answering conditional
+        # requests with 304 Not Modified
+        path = self.translate_path(self.path)
+        try:
+            a = assets.get(path)
+        except OSError:
+            return self.send_error(404)
+        gz = a.gz is not None and self.accepts_gzip()
+        # the gzip-compressed copy is another representation of the file
+        etag = a.etag[:-1] + '-gz"' if gz else a.etag
+        headers = [('ETag', etag), ('Vary', 'Accept-Encoding'),
+                ('Last-Modified', self.date_time_string(a.mtime))]
+        inm = self.headers.get('If-None-Match')
+        ims = self.headers.get('If-Modified-Since')
+        if inm is not None:
+            not_modified = etag in [x.strip() for x in inm.split(',')] or \
+                    inm.strip() == '*'
+        elif ims is not None:
+            try:
+                not_modified = int(a.mtime) <= \
+                        email.utils.parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                not_modified = False
         else:
-            self.send_error(500, f'{key}: {val}')
-            return
+            not_modified = False
+        if not_modified:
+            self.send_response(304)
+            for k, v in headers:
+                self.send_header(k, v)
+            return self.end_headers()
+        data = a.gz if gz else a.data
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(path))
+        if gz:
+            self.send_header('Content-Encoding', 'gzip')
+        for k, v in headers:
+            self.send_header(k, v)
+        self.send_header('Content-Length', len(data))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_previews(self, query):
+        # The sequence files of several effects in one response, so the web
+        # interface does not have to make one request per preview. For each
+        # effect, little-endian: the length of its name (uint8), its name,
+        # the length of its sequence file (uint32) and the sequence file (see
+        # write_bin() in worker_led.py). Effects without a sequence file yet
+        # are left out.
+        names = urllib.parse.parse_qs(query).get('effects', [''])[0]
+        out = []
+        for name in names.split(','):
+            name = os.path.basename(name)
+            bname = name.encode()
+            if not name or len(bname) > 255:
+                continue
+            try:
+                a = assets.get(f'{seq_path}/{name}.bin')
+            except OSError:
+                continue
+            out += [struct.pack('<B', len(bname)), bname,
+                    struct.pack('<I', len(a.data)), a.data]
+        dat = b''.join(out)
         self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', len(dat))
         self.end_headers()
-        self.write_data(json.dumps(resp) + '\n')
+        self.wfile.write(dat)
+
+    def send_empty(self, code, headers=()):
+        self.send_response(code)
+        for k, v in headers:
+            self.send_header(k, v)
+        self.send_header('Content-Length', 0)
+        self.end_headers()
+
+    def query(self, data):
+        # Returns [data, value], or ['error', message]: read the status
+        # published by the led driver if recent enough (it is not published
+        # while the led driver is idle), otherwise ask for it
+        resp = status.get(data, self.status_max_age)
+        return [data, resp] if resp is not None else rpc.call('/get', data)
+
+    def get_data(self, data):
+        key, resp = self.query(data)
+        if key != data:
+            self.send_error(500, f'{key}: {resp}')
+            return
+        if data == '/state':
+            resp.update(effect_lists())
+            resp['sequences'] = sequence_versions()
+        self.send_data(json.dumps(resp) + '\n')
+
+    def profile(self):
+        # Profile an effect in a separate process, so the LED string is not
+        # disturbed, rendering as many pixels as the LED string has at its
+        # current brightness
+        try:
+            j = self.parse_json()
+            effect = os.path.basename(j['effect'])
+            frames = max(1, min(100000, int(j.get('frames', 600))))
+        except (AssertionError, KeyError, TypeError, ValueError, AttributeError):
+            return self.send_error(400,
+                    'expected {"effect": name, "frames": number}')
+        # the profiling process takes CPU time from the led driver, even niced
+        if not self.profile_lock.acquire(blocking=False):
+            return self.send_error(503, 'already profiling an effect')
+        try:
+            key, val = self.query('/state')
+            brightness = val['brightness'] if key == '/state' else None
+            # the web server process has threads, which must not be forked
+            ctx = multiprocessing.get_context('spawn')
+            conn, child_conn = ctx.Pipe()
+            p = ctx.Process(target=profile_process, daemon=True,
+                    name='profile', args=(child_conn, effect,
+                        conf['num_pixels'], frames, self.profile_seconds,
+                        brightness))
+            p.start()
+            if conn.poll(self.profile_timeout):
+                key, val = conn.recv()
+            else:
+                key, val = 'error', f'timed out after {self.profile_timeout} s'
+            p.kill()
+            p.join()
+        finally:
+            self.profile_lock.release()
+        if key != '/profile':
+            self.send_error(500, f'{key}: {val}')
+            return
+        self.send_data(json.dumps(val) + '\n')
 
     def do_GET(self):
         if self.path == '/':
             if not conf['set_up']:
-                self.send_response(302)
-                self.send_header('Location', '/welcome.html')
-                self.end_headers()
-                return
+                return self.send_empty(302, [('Location', '/welcome.html')])
             self.path = '/index.html'
         if self.path.startswith('/get/'):
             return self.get_data(self.path[4:])
+        if self.path.startswith('/previews?'):
+            return self.send_previews(self.path[10:])
         # whitelist of URL paths
         if not self.path.startswith('/sequence/') and \
            self.path not in (
@@ -82,7 +493,7 @@ class MyHandler(SimpleHTTPRequestHandler):
                 '/welcome.html',
                 ):
             return self.send_error(404)
-        return super().do_GET()
+        return self.send_asset()
 
     def do_POST(self):
         if self.path == '/initial_setup':
@@ -96,22 +507,65 @@ class MyHandler(SimpleHTTPRequestHandler):
                 })
             conf_save()
             conf_push()
-            self.send_response(303)
-            self.send_header('Location', '/')
-            self.end_headers()
+            self.send_empty(303, [('Location', '/')])
         elif not conf['set_up']:
             self.send_error(500, 'Server is not set up')
+        elif self.path == '/profile':
+            self.profile()
         elif self.path not in ('/button',):
             self.send_error(404)
         else:
             j = self.parse_json()
             to_led_driver.put([self.path, (j['name'], j.get('value'))])
-            self.send_response(200)
-            self.end_headers()
+            self.send_empty(200)
+
+class ThreadedHTTPServer(ThreadingHTTPServer):
+    # Serves every connection in its own thread, so a slow client does not
+    # block the other ones, with at most max_connections connections at a
+    # time: when they are all taken, new connections wait in the listen
+    # backlog until one is closed.
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, address, handler, max_connections):
+        self.slots = threading.BoundedSemaphore(max_connections)
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except:
+            self.slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.slots.release()
 
-def led_driver_process(to_led_driver, to_web_server):
+def led_driver_process(to_led_driver, to_web_server, shard_conns, status):
     import worker_led
-    worker_led.drive_led_forever(to_led_driver, to_web_server)
+    worker_led.drive_led_forever(to_led_driver, to_web_server, shard_conns,
+            status)
+
+def render_shard_process(conn):
+    import worker_led
+    worker_led.shard_forever(conn)
+
+def profile_process(conn, effect, num_pixels, frames, seconds, brightness):
+    import worker_led
+    worker_led.proc_name = 'profile'
+    if brightness is not None:
+        worker_led.brightness = brightness
+    # leave the CPU to the led driver
+    os.nice(10)
+    try:
+        conn.send(['/profile',
+            worker_led.profile_effect(effect, num_pixels, frames, seconds)])
+    except Exception as e:
+        conn.send(['error', str(e)])
 
 def sequence_generator_process():
     import worker_led
@@ -123,9 +577,17 @@ def main_exit(signal_number, stack_frame):
     sys.exit(0)
 
 def main():
-    global conf
+    global conf, status
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=80)
+    # by default use all the CPU cores but one (left for the web server, the
+    # seqgen, and the led driver itself) to render effects declaring PURE;
+    # os.cpu_count() returns None when the number of CPUs is unknown
+    parser.add_argument('-w', '--render-workers', type=int,
+            default=max(1, min(3, (os.cpu_count() or 2) - 1)))
+    # max number of simultaneous HTTP connections, 0 for a single-threaded
+    # web server serving 1 connection at a time
+    parser.add_argument('-c', '--max-connections', type=int, default=64)
     args = parser.parse_args()
     try:
         conf = json.load(open(conf_file))
@@ -133,15 +595,37 @@ def main():
     except FileNotFoundError:
         conf = { 'set_up': False }
     signal.signal(signal.SIGTERM, main_exit)
-    Process(target=led_driver_process, daemon=True,
-            name='led_driver', args=(to_led_driver, to_web_server)).start()
+    # created before forking the other processes, so they share the resource
+    # tracker the main process starts (see shm_attach() in worker_led.py)
+    status = StatusBlock()
+    # the render_shard processes are started here because the led driver, as
+    # a daemon process, is not allowed to have children (and a single one
+    # would not render faster than the led driver itself)
+    shard_conns = []
+    for i in range(args.render_workers if args.render_workers > 1 else 0):
+        conn, child_conn = Pipe()
+        Process(target=render_shard_process, daemon=True,
+                name='render_shard', args=(child_conn,)).start()
+        shard_conns.append(conn)
+    Process(target=led_driver_process, daemon=True, name='led_driver',
+            args=(to_led_driver, to_web_server, shard_conns, status)).start()
     Process(target=sequence_generator_process, daemon=True,
             name='seqgen', args=()).start()
+    rpc.start()
     # start web server
     HTTPServer.allow_reuse_address = True
-    httpd = HTTPServer(('', args.port), MyHandler)
+    if args.max_connections > 0:
+        # keep connections open between requests (eg. polling /get/state)
+        MyHandler.protocol_version = 'HTTP/1.1'
+        httpd = ThreadedHTTPServer(('', args.port), MyHandler,
+                args.max_connections)
+    else:
+        httpd = HTTPServer(('', args.port), MyHandler)
     print(f'Web server running on port {args.port}/tcp')
-    httpd.serve_forever()
+    try:
+        httpd.serve_forever()
+    finally:
+        status.close()
 
 if __name__ == '__main__':
     main()
@@ -1,5 +1,23 @@
-import time, random, struct, array, math, sys, os, traceback, signal, importlib, importlib.util, colorsys, gpiozero
-from rpi_ws281x import Color, PixelStrip
+import time, random, struct, array, math, sys, os, traceback, signal, importlib, importlib.util, colorsys, collections, ctypes, threading, mmap, zlib, cProfile, pstats
+from multiprocessing import shared_memory
+try:
+    import gpiozero
+except ImportError:
+    gpiozero = None
+try:
+    from rpi_ws281x import Color, PixelStrip
+    import _rpi_ws281x as ws
+except ImportError:
+    # not running on a Raspberry Pi: FakePixelStrip, defined below, will be
+    # used instead
+    PixelStrip = None
+    def Color(red, green, blue, white=0):
+        return (white << 24) | (red << 16) | (green << 8) | blue
+try:
+    # optional: used to convert colors of effects returning NumPy arrays
+    import numpy as np
+except ImportError:
+    np = None
 
 LED_FREQ_HZ = 800000  # LED signal frequency in hertz (usually 800khz)
 LED_DMA = 10          # DMA channel to use for generating signal
@@ -8,14 +26,23 @@ LED_INVERT = False    # True to invert the output signal (useful when using
 LED_BRIGHTNESS = 255  # Set to 0 for darkest and 255 for brightest
 LED_CHANNEL = 0       # set to '1' for GPIOs 13, 19, 41, 45 or 53
 
-fps_goal = 60 # aim at rendering at this fps rate
+fps_goal = 60 # aim at rendering at this fps rate, unless the effect sets FPS
 proc_name = None
 pkg_name = 'effect_library'
 pkg_path = os.path.dirname(__file__) + '/' + pkg_name
 seq_path = os.path.dirname(__file__) + '/www/sequence'
+show_path = os.path.dirname(__file__) + '/shows'
 brightness = 128
+# converts colors for the LED string, or for the sequences in the seqgen
+colorconv = None
+colorcache = None
 # strings must be a global as it's accessed by graceful_exit()
 strings = []
+# connections to the render_shard processes, see ShardedRenderer
+shard_conns = []
+# effects declaring PURE = True are rendered by the render_shard processes
+# on LED strings of at least this many pixels
+shard_min_pixels = 200
 ftimes = []
 _gamma = {}
 colors = {
@@ -87,9 +114,163 @@ def cto8b(color, ɣ=2.2):
         result.append(gamma(val, ɣ))
     return result
 
-def solid(strip, color):
-    for i in range(strip.numPixels()):
-        strip.setPixelColor(i, color)
+class ColorConverter:
+    # Does the same conversion as cto8b(), but with the brightness scaling and
+    # the gamma correction folded into lookup tables, so converting a color
+    # costs a few multiplications and table lookups. The tables depend on the
+    # brightness, so they are rebuilt by set_brightness() when it changes.
+    # Float components are quantized with round(x * brightness) which is the
+    # index in the tables. Values up to 4.0 are in the tables; greater or
+    # negative values go through the slow path _convert() which saturates at
+    # 255 or raises ValueError, like cto8b().
+    overdrive = 4
+
+    def __init__(self, ɣ, brightness):
+        self.ɣ = ɣ
+        self.brightness = None
+        self.set_brightness(brightness)
+
+    def set_brightness(self, brightness):
+        if brightness == self.brightness:
+            return
+        self.brightness = brightness
+        b, ɣ = brightness, self.ɣ
+        # final 8-bit value for a component equal to x * brightness, where
+        # the tables are indexed by round(x * brightness)
+        g = [gamma(min(255, i), ɣ) for i in range(self.overdrive * 256)]
+        self.n = len(g)
+        self.lr = array.array('I', [v << 16 for v in g])
+        self.lg = array.array('I', [v << 8 for v in g])
+        self.lb = array.array('I', g)
+        if np is not None:
+            self.np_lut = np.array(g[:256], dtype=np.uint32)
+        # final 8-bit value for #rrggbb and #rgb hex digits
+        h8 = [gamma(round(c / 255 * b), ɣ) for c in range(256)]
+        self.h8r = array.array('I', [v << 16 for v in h8])
+        self.h8g = array.array('I', [v << 8 for v in h8])
+        self.h8b = array.array('I', h8)
+        self.h4 = [gamma(round(c / 15 * b), ɣ) for c in range(16)]
+
+    def _convert(self, color):
+        # slow path for components out of the range of the tables
+        if type(color) == str:
+            return cto8b(color, self.ɣ)
+        result = []
+        for idx, x in enumerate(color):
+            val = min(255, round(x * self.brightness))
+            if val < 0:
+                raise ValueError(f'Color component {idx} out of range after '
+                                 f'brightness calculation: {x} * '
+                                 f'{self.brightness}. Original color: {color}')
+            result.append(gamma(val, self.ɣ))
+        return result
+
+    def pack(self, color):
+        # Convert a color to a 24-bit integer 0xRRGGBB, as expected by
+        # PixelStrip.setPixelColor()
+        if color.__class__ is str:
+            if len(color) == 7 and color[0] == '#':
+                v = int(color[1:], 16)
+                return self.h8r[v >> 16] | self.h8g[(v >> 8) & 255] | \
+                        self.h8b[v & 255]
+            if len(color) == 4 and color[0] == '#':
+                h4 = self.h4
+                return (h4[int(color[1], 16)] << 16) | \
+                        (h4[int(color[2], 16)] << 8) | h4[int(color[3], 16)]
+            r, g, b = self._convert(color)
+            return (r << 16) | (g << 8) | b
+        r, g, b = color
+        s, n = self.brightness, self.n
+        r, g, b = round(r * s), round(g * s), round(b * s)
+        if 0 <= r < n and 0 <= g < n and 0 <= b < n:
+            return self.lr[r] | self.lg[g] | self.lb[b]
+        r, g, b = self._convert(color)
+        return (r << 16) | (g << 8) | b
+
+    def to8b(self, color):
+        # Convert a color to a tuple of 8-bit values, like cto8b()
+        v = self.pack(color)
+        return (v >> 16, (v >> 8) & 255, v & 255)
+
+    def _lookup_array(self, a):
+        # vectorized conversion of a (N, 3) array of floating-point colors
+        i = np.rint(np.asarray(a, dtype=np.float64) * self.brightness)
+        if i.size and i.min() < 0:
+            raise ValueError('Color component out of range after brightness '
+                             f'calculation: {a.min()} * {self.brightness}')
+        np.minimum(i, 255, out=i)
+        return np.take(self.np_lut, i.astype(np.intp))
+
+    def pack_array(self, a):
+        # Convert a (N, 3) array of colors to a (N,) array of packed colors
+        v = self._lookup_array(a)
+        return (v[:, 0] << 16) | (v[:, 1] << 8) | v[:, 2]
+
+    def to8b_array(self, a):
+        # Convert a (N, 3) array of colors to a (N, 3) array of 8-bit values
+        return self._lookup_array(a).astype(np.uint8)
+
+class ColorCache:
+    # Bounded LRU cache of packed colors indexed by the color values returned by
+    # effect modules (tuples or "#rrggbb" strings). Most effects return the same
+    # handful of colors for most pixels, so a lookup here is much cheaper than
+    # converting them again. It must be cleared when the brightness changes.
+    # The least recently used entries are evicted so effects returning unique
+    # floating-point colors do not grow it without bound. Such effects (eg.
+    # hsv() gradients) miss on almost every pixel, which costs more than not
+    # using the cache at all: when less than min_hit_rate of the lookups of a
+    # frame hit, the cache is bypassed for the next bypass_frames frames, then
+    # tried again, in case the colors of the effect changed.
+    min_hit_rate = .5
+    bypass_frames = 120
+
+    def __init__(self, conv, size=4096):
+        self.conv = conv
+        self.size = size
+        self.cache = collections.OrderedDict()
+        self.lookups = 0
+        self.misses = 0
+        self.bypass = 0
+        self.bypassed = 0
+
+    def clear(self):
+        # must also be called when the effect changes, to evaluate the hit
+        # rate of the new one
+        self.cache.clear()
+        self.bypass = 0
+
+    def pack_frame(self, colors):
+        # Convert the colors of a frame, returns a list of packed colors
+        if self.bypass:
+            self.bypass -= 1
+            self.bypassed += 1
+            return list(map(self.conv.pack, colors))
+        cache, pack = self.cache, self.conv.pack
+        misses = 0
+        out = []
+        for c in colors:
+            try:
+                v = cache[c]
+                cache.move_to_end(c)
+            except KeyError:
+                v = cache[c] = pack(c)
+                misses += 1
+                if len(cache) > self.size:
+                    cache.popitem(last=False)
+            except TypeError:
+                # unhashable colors (eg. lists) are not cached
+                v = pack(c)
+                misses += 1
+            out.append(v)
+        self.lookups += len(colors)
+        self.misses += misses
+        if misses > (1 - self.min_hit_rate) * len(colors):
+            self.bypass = self.bypass_frames
+        return out
+
+    def stats(self):
+        return { 'hits': self.lookups - self.misses, 'misses': self.misses,
+                'entries': len(self.cache), 'bypassed_frames': self.bypassed }
 
 #
 # Effects
@@ -110,6 +291,9 @@ def mul(color, f):
 def enrich_namespace(num_pixels, mod):
     # put some variables and functions in the module's namespace
     mod.num_pixels = num_pixels
+    # time base, see set_time()
+    mod.t = 0
+    mod.dt = 0
     mod.rgb = rgb
     mod.hsv = hsv
     mod.dim = dim
@@ -143,87 +327,653 @@ def fx_load(num_pixels, mod_name):
         # internal importlib entries
         err(''.join(traceback.format_exception(*sys.exc_info(), limit=-1)))
         return None
-    if not hasattr(m, 'render') or not callable(m.render):
-        err(f'{pkg_path}/{mod_file}: function "render()" not found')
+    if not callable(getattr(m, 'render', None)) and \
+       not callable(getattr(m, 'render_frame', None)):
+        err(f'{pkg_path}/{mod_file}: function "render()" or "render_frame()"'
+            ' not found')
         return None
     return m
 
+def set_time(m, t):
+    # Effect modules can animate according to the time rather than the frame
+    # number, so their speed does not depend on the frame rate: t is the time
+    # of the frame in seconds since the effect started, and dt the time since
+    # the previous call of before_frame(), or previous frame if there is none
+    m.dt = t - m.t
+    m.t = t
+
+def render_colors(m, num_pixels, frame, out, step=1, before_frame=True,
+        t=None):
+    # Return the colors of all the pixels of a frame, as returned by the effect
+    # module. Modules defining render_frame(frame, out) fill the whole out[]
+    # list in one call, which avoids num_pixels Python function calls, or may
+    # return a (num_pixels, 3) NumPy array of floating-point RGB values;
+    # others fall back to calling render(index, frame) for every pixel, or
+    # only for the pixels coarse_pixels(num_pixels, step) if step > 1. t is
+    # the time of the frame, frame / 60 by default.
+    has_before = hasattr(m, 'before_frame')
+    if before_frame or not has_before:
+        set_time(m, frame / 60 if t is None else t)
+    t = time.perf_counter()
+    if before_frame and has_before:
+        m.before_frame(frame)
+        t2 = time.perf_counter()
+        stats.add('before_frame', t2 - t)
+        t = t2
+    if hasattr(m, 'render_frame'):
+        a = m.render_frame(frame, out)
+        if a is not None:
+            out = a
+    elif step > 1:
+        render = m.render
+        out = [render(i, frame) for i in coarse_pixels(num_pixels, step)]
+    else:
+        render = m.render
+        out[:] = [render(i, frame) for i in range(num_pixels)]
+    stats.add('render', time.perf_counter() - t)
+    return out
+
+def is_array(colors):
+    return np is not None and isinstance(colors, np.ndarray)
+
+def coarse_pixels(num_pixels, step):
+    # every step-th pixel, and the last one
+    idx = list(range(0, num_pixels, step))
+    if idx[-1] != num_pixels - 1:
+        idx.append(num_pixels - 1)
+    return idx
+
+def upsample(packed, num_pixels, step):
+    # Returns an array('I') of the packed colors of all the pixels, linearly
+    # interpolated from the packed colors of coarse_pixels(num_pixels, step)
+    idx = coarse_pixels(num_pixels, step)
+    if np is not None:
+        c = np.frombuffer(packed, dtype=np.uint32)
+        x = np.arange(num_pixels)
+        out = np.zeros(num_pixels, dtype=np.uint32)
+        for shift in (16, 8, 0):
+            v = np.interp(x, idx, (c >> shift) & 255)
+            out |= np.rint(v).astype(np.uint32) << shift
+        return array.array('I', out.tobytes())
+    out = array.array('I', bytes(4 * num_pixels))
+    for k in range(len(idx) - 1):
+        a, b, ca, cb = idx[k], idx[k + 1], packed[k], packed[k + 1]
+        if ca == cb:
+            out[a:b] = array.array('I', [ca]) * (b - a)
+            continue
+        w = b - a
+        r, g, bl = ca >> 16, (ca >> 8) & 255, ca & 255
+        dr, dg, db = (cb >> 16) - r, ((cb >> 8) & 255) - g, (cb & 255) - bl
+        h = w // 2 # to round to the nearest
+        for j in range(w):
+            out[a + j] = ((r + (dr * j + h) // w) << 16) | \
+                    ((g + (dg * j + h) // w) << 8) | (bl + (db * j + h) // w)
+    out[-1] = packed[-1]
+    return out
+
 #
 # Core code
 #
 
+class FakePixelStrip:
+    # Stand-in for rpi_ws281x's PixelStrip when not running on a Raspberry Pi,
+    # eg. to benchmark or test the rendering code. The colors of the pixels
+    # are in leds, and show() copies them to shown. Set transmit_time to the
+    # time in seconds to send 1 pixel to simulate the blocking time of a real
+    # LED string (30e-6 for 800 kHz)
+    transmit_time = 0
+
+    def __init__(self, num, pin, *args):
+        self.leds = array.array('I', bytes(4 * num))
+        self.shown = array.array('I', self.leds)
+        self.nr_shows = 0
+    def begin(self):
+        pass
+    def numPixels(self):
+        return len(self.leds)
+    def setPixelColor(self, n, color):
+        self.leds[n] = color
+    def getPixelColor(self, n):
+        return self.leds[n]
+    def show(self):
+        self.shown = array.array('I', self.leds)
+        self.nr_shows += 1
+        if self.transmit_time:
+            time.sleep(self.transmit_time * len(self.leds))
+
+def leds_address(ps):
+    # Return the address of the array of colors of the LED string, so a whole
+    # frame can be copied to it with one memmove() instead of one
+    # setPixelColor() call per pixel. Returns None if it cannot be found.
+    if isinstance(ps, FakePixelStrip):
+        return ps.leds.buffer_info()[0]
+    try:
+        n = ps.numPixels()
+        addr = int(ws.ws2811_channel_t_leds_get(ps._channel))
+        # make sure we found the same memory as what setPixelColor() writes
+        ps.setPixelColor(n - 1, 0x123456)
+        if ctypes.c_uint32.from_address(addr + 4 * (n - 1)).value != 0x123456:
+            return None
+        return addr
+    except Exception:
+        return None
+
 class PixelString:
     def __init__(self, num_pixels, led_pin, inverted):
         self.num_pixels = num_pixels
         # led_pin is GPIO pin to led string (18 uses PWM, 10 uses SPI, etc)
         self.led_pin = led_pin
-        self.ps = PixelStrip(num_pixels, led_pin, LED_FREQ_HZ, LED_DMA,
-                                LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL)
+        if PixelStrip is None:
+            log('rpi_ws281x not found, rendering on a fake LED string')
+            self.ps = FakePixelStrip(num_pixels, led_pin)
+        else:
+            self.ps = PixelStrip(num_pixels, led_pin, LED_FREQ_HZ, LED_DMA,
+                                    LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL)
         self.ps.begin()
-        self.relay = gpiozero.LED(15)
+        self.leds_addr = leds_address(self.ps)
+        self.relay = gpiozero.LED(15) if gpiozero else None
         self.effect = None
         self.fx_mod = None
         self.inverted = inverted
-    def start(self, effect, fx_mtime, fx_mod):
+        # colors of the current frame, filled by render_colors()
+        self.colors = [colors['black']] * num_pixels
+        # last frame sent to the LED string, see show_frame()
+        self.last = None
+        # False once a static effect is rendered, see render_frames()
+        self.need_render = True
+        # frame number last rendered
+        self.rendered_frame = 0
+        self.sharded = None
+        self.loop = None
+        self.keyframes = None
+        self.player = None
+        self.skipped_renders = 0
+        self.skipped_shows = 0
+        self.nr_renders = 0
+        self.frame = 0
+        self.t = 0
+    def show_frame(self, buf):
+        # Send a whole frame of packed colors, an array('I'), to the LED string.
+        # Nothing is sent if it is identical to the last frame sent.
+        if buf == self.last:
+            self.skipped_shows += 1
+            return
+        self.last = buf
+        t = time.perf_counter()
+        if self.inverted:
+            buf = buf[::-1]
+        if self.leds_addr:
+            ctypes.memmove(self.leds_addr, buf.buffer_info()[0], 4 * len(buf))
+        else:
+            for i, v in enumerate(buf):
+                self.ps.setPixelColor(i, v)
+        t2 = time.perf_counter()
+        self.ps.show()
+        stats.add('upload', t2 - t)
+        stats.add('show', time.perf_counter() - t2)
+    def start(self, effect, fx_mtime, fx_mod, player=None):
+        # effect is the name of the effect module fx_mod, or of the compiled
+        # show played by player
+        if self.player:
+            self.player.close()
         self.effect = effect
         self.fx_mtime = fx_mtime
         self.fx_mod = fx_mod
+        self.player = player
         self.last_stat = 0
         self.frame = 0
+        self.t = 0
+        self.last = None
+        self.need_render = True
+        self.reset_loop()
+        self.reset_keyframes()
+        self.use_shards()
+        self.skipped_renders = 0
+        self.skipped_shows = 0
+        self.nr_renders = 0
         if self.relay:
             self.relay.on()
+    def advance(self, n):
+        # Advance the animation by n frames. The time of the frames, t, is
+        # derived from the frame numbers at the nominal fps of the effect (the
+        # governor and the frame scheduler skip frame numbers to keep up)
+        self.frame += n
+        self.t += n / min(fps_goal, getattr(self.fx_mod, 'FPS', fps_goal))
+    def use_shards(self):
+        # render the effect with the render_shard processes if it is PURE
+        if self.sharded:
+            self.sharded.close()
+            self.sharded = None
+        m = self.fx_mod
+        if shard_conns and self.num_pixels >= shard_min_pixels and \
+                getattr(m, 'PURE', False) and not hasattr(m, 'render_frame'):
+            try:
+                self.sharded = ShardedRenderer(shard_conns, self.num_pixels,
+                        self.effect, getattr(m, 'RESOLUTION', 1))
+            except Exception as e:
+                # the led driver renders the effect itself
+                log(f'{self.effect}: not rendered by the shards: {e}')
+    def reset_loop(self):
+        # evict the cached cycle of frames, if any, see LoopCache
+        period = getattr(self.fx_mod, 'PERIOD', None)
+        self.loop = LoopCache(self.num_pixels, period) if period else None
+    def reset_keyframes(self):
+        # see KeyframeInterpolator
+        kfps = getattr(self.fx_mod, 'KEYFRAME_FPS', None)
+        self.keyframes = KeyframeInterpolator(kfps) if kfps else None
     def stop(self):
+        if self.player:
+            self.player.close()
         self.effect = None
         self.fx_mtime = None
         self.fx_mod = None
-        solid(self.ps, Color(0, 0, 0))
-        self.ps.show()
+        self.player = None
+        self.use_shards()
+        self.reset_loop()
+        self.reset_keyframes()
+        self.show_frame(array.array('I', bytes(4 * self.num_pixels)))
         if self.relay:
             self.relay.off()
 
-def render_one_frame(strings):
-    ftimes.insert(0, time.time())
+class LoopCache:
+    # Records the packed frames of a periodic effect and, once a full cycle is
+    # recorded, replays it from memory instead of rendering the effect.
+    # Effect modules declare PERIOD = N if their frames repeat every N frames,
+    # or PERIOD = True to let the period be detected by hashing the frames: it
+    # is the smallest period consistent with all the frames recorded so far,
+    # and is trusted once it held for two full cycles and at least min_verify
+    # frames. Recording gives up when the cycle does not fit in max_bytes.
+    max_bytes = 32 << 20
+    min_verify = 120
+
+    def __init__(self, num_pixels, period):
+        self.num_pixels = num_pixels
+        self.auto = period is True
+        self.period = None if self.auto else period
+        self.ready = False
+        self.failed = False
+        self.reset(None)
+
+    def reset(self, frame):
+        self.start = frame
+        self.buf = array.array('I')
+        self.hashes = []
+        # candidate periods when auto-detecting the period
+        self.candidates = []
+
+    def state(self):
+        return { 'period': self.period, 'bytes': len(self.buf) * 4,
+                'replaying': self.ready }
+
+    def record(self, frame, packed):
+        if self.ready or self.failed:
+            return
+        if self.start is None or frame != self.start + len(self.hashes):
+            # the recorded frames must be consecutive
+            self.reset(frame)
+        if (len(self.buf) + len(packed)) * 4 > self.max_bytes:
+            log('effect cycle too long to be cached')
+            self.failed = True
+            self.reset(None)
+            return
+        self.buf.extend(packed)
+        h = self.hashes
+        h.append(hash(packed.tobytes()) if self.auto else None)
+        j = len(h) - 1
+        if self.auto:
+            self.candidates = [q for q in self.candidates if h[j] == h[j - q]]
+            if j and h[j] == h[0]:
+                self.candidates.append(j)
+            self.period = self.candidates[0] if self.candidates else None
+            p = self.period
+            if not p or j + 1 < max(2 * p, p + self.min_verify):
+                return
+            del self.buf[p * self.num_pixels:]
+        elif j + 1 < self.period:
+            return
+        log(f'replaying cached cycle of {self.period} frames')
+        self.ready = True
+        self.hashes = [None] * self.period
+
+    def replay(self, frame):
+        k = (frame - self.start) % self.period
+        return self.buf[k * self.num_pixels:(k + 1) * self.num_pixels]
+
+class KeyframeInterpolator:
+    # Renders an effect module declaring KEYFRAME_FPS = N only N times per
+    # second, and the frames in between by cross-fading the 2 most recent
+    # keyframes, which is enough for slow and smooth effects and divides the
+    # rendering time by the ratio of the fps to N. The effect is shown one
+    # keyframe period late. KEYFRAME_FPS = True picks the keyframe period so
+    # rendering the keyframes takes a quarter of the time, with at least
+    # min_fps keyframes per second.
+    min_fps = 10
+
+    def __init__(self, fps):
+        self.auto = fps is True
+        self.period = 0 if self.auto else 1 / fps
+        self.render_time = None
+        self.prev = self.next = None
+        self.prev_t = self.next_t = 0
+
+    def frame(self, t, render):
+        # Returns the frame at time t; render() renders the keyframe at t
+        if self.next is None or t >= self.next_t + self.period - 1e-6:
+            t0 = time.perf_counter()
+            packed = render()
+            if self.auto:
+                dt = time.perf_counter() - t0
+                self.render_time = dt if self.render_time is None else \
+                        self.render_time + (dt - self.render_time) * .2
+                self.period = min(1 / self.min_fps, 4 * self.render_time)
+            if self.next is None:
+                self.next, self.next_t = packed, t
+            self.prev, self.prev_t = self.next, self.next_t
+            self.next, self.next_t = packed, t
+        if self.next_t <= self.prev_t:
+            return self.next
+        return blend(self.prev, self.next,
+                min(1, (t - self.next_t) / (self.next_t - self.prev_t)))
+
+def blend(a, b, alpha):
+    # Cross-fade 2 frames of packed colors: returns a * (1 - alpha) + b * alpha
+    w = round(alpha * 256)
+    if w == 0:
+        return a
+    if w == 256:
+        return b
+    if np is not None:
+        # blend the 4 bytes of every packed color at once
+        x = np.frombuffer(a, dtype=np.uint8).astype(np.uint16)
+        y = np.frombuffer(b, dtype=np.uint8).astype(np.uint16)
+        v = (x * (256 - w) + y * w + 128) >> 8
+        return array.array('I', v.astype(np.uint8).tobytes())
+    iw = 256 - w
+    out = array.array('I', a)
+    for i, (p, q) in enumerate(zip(a, b)):
+        if p != q:
+            out[i] = (((p >> 16) * iw + (q >> 16) * w + 128) >> 8 << 16) | \
+                ((((p >> 8) & 255) * iw + ((q >> 8) & 255) * w + 128) >> 8
+                    << 8) | (((p & 255) * iw + (q & 255) * w + 128) >> 8)
+    return out
+
+def resolution(m):
+    # Effect modules may declare RESOLUTION = N to only render every N-th pixel,
+    # the other ones are interpolated, see coarse_pixels(). Otherwise the
+    # governor may lower the resolution; RESOLUTION = 1 opts out.
+    if hasattr(m, 'render_frame'):
+        return 1
+    return getattr(m, 'RESOLUTION', governor.resolution)
+
+def render_packed(st):
+    # Render the frame st.frame of the effect of a LED string, returns the
+    # packed colors
+    if st.sharded:
+        packed = st.sharded.render(st.frame, st.t, colorconv.brightness)
+        step = st.sharded.step
+        t = time.perf_counter()
+    else:
+        m = st.fx_mod
+        step = resolution(m)
+        # degradation applied by the governor
+        before = not (governor.skip_before_frame and st.nr_renders % 2)
+        cols = render_colors(m, st.num_pixels, st.frame, st.colors, step,
+                before, st.t)
+        t = time.perf_counter()
+        if is_array(cols):
+            packed = array.array('I', colorconv.pack_array(cols).tobytes())
+        else:
+            packed = array.array('I', colorcache.pack_frame(cols))
+    if step > 1:
+        packed = upsample(packed, st.num_pixels, step)
+    stats.add('convert', time.perf_counter() - t)
+    st.nr_renders += 1
+    return packed
+
+def render_frames(strings):
+    # Render stage: returns a list of (string, frame of packed colors) to send
+    # to the LED strings
+    t = time.perf_counter()
+    ftimes.insert(0, time.monotonic())
     if len(ftimes) > 30:
         ftimes.pop()
+    frames = []
     for st in strings:
-        if hasattr(st.fx_mod, 'before_frame'):
-            st.fx_mod.before_frame(st.frame)
-        for i in range(st.num_pixels):
-            phys_i = i if not st.inverted else st.num_pixels - 1 - i
-            # do not pass a 2nd arg to cto8b() so as to perform gamma-correction
-            # as we are rendering on a physical LED string
-            st.ps.setPixelColor(phys_i, Color(*cto8b(st.fx_mod.render(i, st.frame))))
-        st.ps.show()
-        st.frame += 1
+        # Effect modules may declare STATIC = True if they always render the
+        # same frame, or STATIC = N if their frames only change every N frames,
+        # ie. when frame // N changes (frame numbers may be skipped, so not
+        # only on multiples of N)
+        static = getattr(st.fx_mod, 'STATIC', False)
+        if static and not st.need_render and (static is True or
+                st.frame // static == st.rendered_frame // static):
+            st.skipped_renders += 1
+            st.advance(governor.fps_divisor)
+            continue
+        if st.player:
+            packed = st.player.frame(st.frame)
+        elif st.loop and st.loop.ready:
+            packed = st.loop.replay(st.frame)
+        elif st.keyframes:
+            packed = st.keyframes.frame(st.t, lambda: render_packed(st))
+        else:
+            packed = render_packed(st)
+        if st.loop:
+            st.loop.record(st.frame, packed)
+        frames.append((st, packed))
+        st.need_render = False
+        st.rendered_frame = st.frame
+        # when the governor halves the fps, frame numbers are skipped so the
+        # animation speed does not change
+        st.advance(governor.fps_divisor)
+    stats.add('render_frames', time.perf_counter() - t)
+    return frames
+
+def show_frames(frames):
+    # Transmit stage: send the frames returned by render_frames()
+    t = time.perf_counter()
+    for st, buf in frames:
+        st.show_frame(buf)
+    stats.add('show_frames', time.perf_counter() - t)
+
+def render_one_frame(strings):
+    show_frames(render_frames(strings))
+
+class StageTimes:
+    # Durations of one stage of the hot path: the last ring_size ones in a ring
+    # buffer, to compute percentiles, and a histogram of all of them, bucket k
+    # counting the durations of 2**(k-1) to 2**k µs (bucket 0 is < 1 µs)
+    ring_size = 1024
+    nr_buckets = 24
+
+    def __init__(self):
+        self.ring = array.array('d', bytes(8 * self.ring_size))
+        self.hist = array.array('L', bytes(array.array('L').itemsize *
+                self.nr_buckets))
+        self.count = 0
+        self.max = 0
+
+    def add(self, t):
+        self.ring[self.count % self.ring_size] = t
+        self.count += 1
+        self.hist[min(int(t * 1e6).bit_length(), self.nr_buckets - 1)] += 1
+        if t > self.max:
+            self.max = t
+
+    def mean(self):
+        n = min(self.count, self.ring_size)
+        return sum(self.ring[:n]) / n if n else 0
+
+    def report(self):
+        # durations in milliseconds
+        r = sorted(self.ring[:min(self.count, self.ring_size)]) or [0]
+        pct = lambda p: r[min(len(r) - 1, int(p * len(r)))] * 1e3
+        return { 'count': self.count, 'p50': pct(.5), 'p95': pct(.95),
+                'p99': pct(.99), 'max': self.max * 1e3,
+                'hist': self.hist.tolist() }
+
+class Stats:
+    # Timings of the stages of the hot path, fed with time.perf_counter()
+    # intervals. Recording a duration costs about a microsecond, sorting
+    # is only done when the stats are requested.
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, t):
+        try:
+            self.stages[stage].add(t)
+        except KeyError:
+            self.stages[stage] = StageTimes()
+            self.stages[stage].add(t)
+
+    def mean(self, stage):
+        return self.stages[stage].mean() if stage in self.stages else 0
+
+    def report(self):
+        # the transmitter thread may add stages meanwhile: iterate over a copy
+        return { k: v.report() for k, v in list(self.stages.items()) }
+
+stats = Stats()
+
+class FrameTransmitter:
+    # Runs the transmit stage in a thread, so the next frame can be rendered
+    # while the current one is being sent to the LED strings (the ws281x
+    # driver takes ~30 µs per pixel). This double buffering makes the frame
+    # time max(render, transmit) instead of render + transmit. submit() waits
+    # for the previous frame to be sent before handing over the next one.
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = None
+        self.busy = False
+        threading.Thread(target=self.run, name='transmit', daemon=True).start()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                frames, self.pending = self.pending, None
+                self.busy = True
+                self.cond.notify_all()
+            try:
+                show_frames(frames)
+            except Exception:
+                err(f'exception:\n' +
+                    ''.join(traceback.format_exception(*sys.exc_info())))
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+
+    def submit(self, frames):
+        with self.cond:
+            self.drain()
+            self.pending = frames
+            self.cond.notify_all()
+            # wait for the transmitter thread to pick up the frame, otherwise
+            # it may have to wait for the GIL until the next switch interval
+            while self.pending is not None:
+                self.cond.wait()
+
+    def drain(self):
+        # wait for all the submitted frames to be sent; must be called before
+        # accessing the LED strings from another thread
+        with self.cond:
+            while self.pending is not None or self.busy:
+                self.cond.wait()
+
+transmitter = None
 
 def check_edits(strings, to_led_driver):
     now = time.time()
     for st in strings:
-        if st.effect and abs(now - st.last_stat) > .5:
+        if st.fx_mod and abs(now - st.last_stat) > .5:
             st.last_stat = now
+            t = time.perf_counter()
             new_mtime = fx_getmtime(st.effect)
+            stats.add('check_edits', time.perf_counter() - t)
             if new_mtime != st.fx_mtime:
                 log(f'module file for effect "{st.effect}" changed, reloading')
                 # led driver process sends a msg to itself to reload the effect
                 to_led_driver.put(['/button', ('effect', st.effect)])
 
+def get_state(strings):
+    # called for every status published, so it must not touch the file
+    # system: the lists of effects and shows are added by the web server,
+    # see effect_lists() in ledthemfight.py
+    lf = len(ftimes)
+    return {
+        'nr_led_strings': len(strings),
+        'brightness': brightness,
+        'rendering': [st.effect for st in strings],
+        'fps': lf / (ftimes[0] - ftimes[-1]) if lf > 1 else 0,
+        'fps_goal': target_fps(strings),
+        'fps_policy': scheduler.policy,
+        'missed_deadlines': scheduler.missed,
+        'render_ms': stats.mean('render_frames') * 1e3,
+        'transmit_ms': stats.mean('show_frames') * 1e3,
+        'skipped_renders': sum(st.skipped_renders for st in strings),
+        'skipped_shows': sum(st.skipped_shows for st in strings),
+        'color_cache': colorcache.stats(),
+        'loop_cache': [st.loop.state() if st.loop else None
+            for st in strings],
+        'governor': governor.state(),
+        }
+
+def get_stats(strings):
+    return {
+        'stages': stats.report(),
+        'missed_deadlines': scheduler.missed,
+        'skipped_renders': sum(st.skipped_renders for st in strings),
+        'skipped_shows': sum(st.skipped_shows for st in strings),
+        }
+
 def do_get(to_web_server, strings, arg):
-    if arg == '/state':
-        fxs = [x[:-3] for x in sorted(os.listdir(pkg_path)) if x.endswith('.py')]
-        lf = len(ftimes)
-        to_web_server.put([arg, {
-            'nr_led_strings': len(strings),
-            'brightness': brightness,
-            'effects': fxs,
-            'rendering': [st.effect for st in strings],
-            'fps': lf / (ftimes[0] - ftimes[-1]) if lf > 1 else 0,
-            }])
-    else:
-        to_web_server.put(['error', f'invalid request: /get{arg}'])
+    # reply to a call of the web server, see LedDriverRPC in ledthemfight.py
+    call_id, path = arg
+    try:
+        if path == '/state':
+            reply = [path, get_state(strings)]
+        elif path == '/stats':
+            reply = [path, get_stats(strings)]
+        else:
+            reply = ['error', f'invalid request: /get{path}']
+    except Exception as e:
+        err(f'exception:\n' +
+            ''.join(traceback.format_exception(*sys.exc_info())))
+        reply = ['error', str(e)]
+    to_web_server.put([call_id] + reply)
+
+status_period = .25 # publish the status of the led driver every .25 s
+status_time = 0
+stats_time = 0
+published_stats = None
+
+def publish_status(status, strings, now=False):
+    # Publish the status of the led driver in the StatusBlock of the web
+    # server (see ledthemfight.py) every status_period seconds, or now; the
+    # stats, which take a while to compute, are only published once a second
+    # while the web server wants them
+    global status_time, stats_time, published_stats
+    mt = time.monotonic()
+    if status is None or (not now and mt - status_time < status_period):
+        return
+    t = time.perf_counter()
+    status_time = mt
+    if mt - stats_time >= 1 and status.wanted():
+        stats_time = mt
+        published_stats = [mt, get_stats(strings)]
+    dat = { '/state': [mt, get_state(strings)] }
+    if published_stats:
+        dat['/stats'] = published_stats
+    status.write(dat)
+    stats.add('publish', time.perf_counter() - t)
 
 def do_initial_setup(strings, conf):
     log(f'configuring {conf["nr_led_strings"]} led string(s)'
         f' with {conf["num_pixels"]} pixel(s)')
+    transmitter.drain()
+    for st in strings:
+        # release its render_shard shared memory or compiled show
+        st.stop()
     strings.clear()
     strings.append(PixelString(conf["num_pixels"], 18, conf["inverted"]))
 
@@ -235,28 +985,213 @@ def do_effect(strings, effect):
         if mod == None:
             return
         log(f'showing effect {effect}')
+        colorcache.clear()
         strings[0].start(effect, mtime, mod)
+        scheduler.reset()
+        governor.reset()
     except FileNotFoundError:
         log(f'no such effect: {effect}')
 
+def do_show(strings, name):
+    fname = f'{show_path}/{os.path.basename(name)}.show'
+    if not os.path.exists(fname):
+        log(f'no such compiled show: {fname}')
+        return
+    player = ShowPlayer(fname)
+    if player.num_pixels != strings[0].num_pixels:
+        player.close()
+        log(f'compiled show {fname} is for {player.num_pixels} pixels, not '
+            f'{strings[0].num_pixels}')
+        return
+    log(f'playing compiled show {fname} ({player.n_frames} frames at '
+        f'{player.fps} fps, brightness {player.brightness})')
+    strings[0].start(name, None, None, player)
+    scheduler.reset()
+    governor.reset()
+
 def do_button(strings, arg):
     b_name, b_val = arg
     if b_name == 'effect':
         do_effect(strings, b_val)
+    elif b_name == 'show':
+        do_show(strings, b_val)
     elif b_name == 'stop':
         log('stopping effect')
+        transmitter.drain()
         strings[0].stop()
         ftimes.clear()
+        scheduler.reset()
+        governor.reset()
+    elif b_name == 'fps':
+        global fps_goal
+        fps_goal = max(1, min(240, int(b_val)))
+        log(f'target fps set to {fps_goal}')
+        for st in strings:
+            # cached cycles of frames are only valid at the same fps
+            st.reset_loop()
+    elif b_name == 'fps_policy':
+        if b_val not in FrameScheduler.policies:
+            raise Exception(f'unknown fps policy {b_val}')
+        scheduler.policy = b_val
+    elif b_name == 'governor':
+        # comma-separated list of degradations, empty to disable the governor
+        governor.configure([x for x in (b_val or '').split(',') if x])
     elif b_name == 'brightness':
         global brightness
         brightness = max(1, min(255, int(b_val)))
+        colorconv.set_brightness(brightness)
+        colorcache.clear()
+        for st in strings:
+            # force static and cached effects to be rendered again
+            st.need_render = True
+            st.reset_loop()
+            st.reset_keyframes()
 
-def wait_next_frame():
-    if not(len(ftimes)):
-        return
-    s = ftimes[0] + 1 / fps_goal - time.time()
-    if s > 50e-6: # don't bother to sleep for less than 50 µsec
-        time.sleep(s)
+class FrameScheduler:
+    # Paces frames on a fixed schedule of time.monotonic() deadlines, 1/fps
+    # apart. Deadlines are derived from the previous deadline, not from when
+    # the frame was rendered, so the frame rate does not drift, and steps of
+    # the wall clock (eg. NTP) do not matter. When a frame is rendered too late
+    # to meet the next deadline, the policy decides what to do:
+    # - 'catchup': render the late frames back-to-back without sleeping until
+    #   back on schedule; if more than max_catchup frames late, give up and
+    #   resume the schedule from now
+    # - 'skip': resume the schedule from now, and skip the frame numbers of
+    #   the missed deadlines so the animation is not slowed down
+    policies = ('catchup', 'skip')
+
+    def __init__(self, policy='catchup', max_catchup=3):
+        self.policy = policy
+        self.max_catchup = max_catchup
+        self.deadline = None
+        self.missed = 0
+        # last deadline counted in missed
+        self.counted = None
+
+    def reset(self):
+        self.deadline = None
+        self.counted = None
+
+    def wait(self, fps):
+        # Wait for the deadline of the next frame. Returns the number of frame
+        # numbers to skip.
+        period = 1 / fps
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+            return 0
+        self.deadline += period
+        late = now - self.deadline
+        if late < 0:
+            if late < -50e-6: # don't bother to sleep for less than 50 µsec
+                time.sleep(-late)
+            return 0
+        missed = int(late / period)
+        if missed:
+            # while catching up, the next calls see the same missed deadlines
+            # again: only count the ones after the last one counted
+            new = missed
+            if self.counted is not None and self.counted > self.deadline:
+                new -= round((self.counted - self.deadline) / period)
+            self.missed += max(0, new)
+            self.counted = self.deadline + missed * period
+        if self.policy == 'skip' or missed > self.max_catchup:
+            self.deadline = now
+            return missed if self.policy == 'skip' else 0
+        return 0
+
+scheduler = FrameScheduler()
+
+class Governor:
+    # Lowers the rendering quality when an effect is too slow to render at the
+    # target fps, and restores it when there is headroom again: when the
+    # average render time is above high times the frame period, the next
+    # degradation of the enabled list is applied; when it is below low times
+    # the frame period, the last one applied is removed. Quality is not changed
+    # more often than every hold seconds, to let the render time settle, and
+    # every time restoring quality turns out to be too slow, the time before
+    # trying again is doubled.
+    # Degradations:
+    # - 'half_fps': render at half the fps, skipping every other frame number
+    #   so the animation speed does not change
+    # - 'skip_before_frame': only call before_frame() every other frame
+    # - 'half_resolution': only render every other pixel, the other ones are
+    #   interpolated (not for effects defining render_frame() or declaring
+    #   RESOLUTION, see resolution())
+    degradations = ('half_fps', 'skip_before_frame', 'half_resolution')
+
+    def __init__(self, enabled=degradations, high=.9, low=.4, hold=2):
+        self.enabled = list(enabled)
+        self.high = high
+        self.low = low
+        self.hold = hold
+        self.reset()
+
+    def configure(self, enabled):
+        for d in enabled:
+            if d not in self.degradations:
+                raise Exception(f'unknown degradation {d}')
+        self.enabled = list(enabled)
+        self.reset()
+
+    def reset(self):
+        self.set_level(0)
+        self.avg = None
+        self.changed = time.monotonic()
+        self.restored = False
+        self.backoff = 1
+
+    def active(self):
+        return self.enabled[:self.level]
+
+    def set_level(self, level):
+        self.level = level
+        active = self.active()
+        self.fps_divisor = 2 if 'half_fps' in active else 1
+        self.skip_before_frame = 'skip_before_frame' in active
+        self.resolution = 2 if 'half_resolution' in active else 1
+
+    def update(self, t, fps):
+        # t is the time it took to render the last frame at the target fps
+        self.avg = t if self.avg is None else self.avg + (t - self.avg) * .1
+        now = time.monotonic()
+        if now - self.changed < self.hold:
+            return
+        if self.avg > self.high / fps and self.level < len(self.enabled):
+            if self.restored:
+                self.backoff = min(32, self.backoff * 2)
+            self.restored = False
+            self.set_level(self.level + 1)
+            log(f'rendering too slow ({self.avg * 1e3:.1f} ms per frame), '
+                f'degrading quality: {self.enabled[self.level - 1]}')
+        elif self.avg < self.low / fps and self.level and \
+                now - self.changed >= self.hold * self.backoff:
+            self.restored = True
+            log(f'restoring quality: {self.enabled[self.level - 1]}')
+            self.set_level(self.level - 1)
+        else:
+            return
+        self.changed = now
+        self.avg = None
+
+    def state(self):
+        return { 'level': self.level, 'active': self.active(),
+                'enabled': self.enabled }
+
+governor = Governor()
+
+def target_fps(strings):
+    # effect modules may declare a lower FPS than fps_goal
+    fps = fps_goal
+    for st in strings:
+        if st.player:
+            # compiled shows are played at the fps they were compiled for,
+            # divided like effects by the governor as render_frames() skips
+            # frames accordingly
+            fps = st.player.fps
+            break
+        fps = min(fps, getattr(st.fx_mod, 'FPS', fps))
+    return fps / governor.fps_divisor
 
 def button_handlers(to_led_driver):
     button = gpiozero.Button(23)
@@ -265,40 +1200,350 @@ def button_handlers(to_led_driver):
     button.when_released = \
         lambda : to_led_driver.put(['/button', ('effect', 'TurnOff')])
 
+def do_msg(to_web_server, strings, msg):
+    # messages are received several at a time, so an invalid one must not
+    # prevent the next ones from being handled
+    action, arg = msg
+    try:
+        if action == '/get':
+            do_get(to_web_server, strings, arg)
+        elif action == '/initial_setup':
+            do_initial_setup(strings, arg)
+        elif action == '/button':
+            do_button(strings, arg)
+        else:
+            raise Exception(f'unknown action {action}')
+    except Exception:
+        err(f'exception:\n' +
+            ''.join(traceback.format_exception(*sys.exc_info())))
+
 def graceful_exit(signal_number, stack_frame):
+    if transmitter:
+        transmitter.drain()
     for st in strings:
         st.stop()
     sys.exit(0)
 
-def drive_led_forever(to_led_driver, to_web_server):
-    global proc_name
+def drive_led_forever(to_led_driver, to_web_server, conns=(), status=None):
+    global proc_name, colorconv, colorcache, transmitter
     proc_name = 'led_driver'
+    shard_conns.extend(conns)
+    # gamma-correct colors as we are rendering on a physical LED string
+    colorconv = ColorConverter(2.2, brightness)
+    colorcache = ColorCache(colorconv)
+    transmitter = FrameTransmitter()
+    # let the transmitter thread get the GIL back sooner than the default 5 ms
+    # when it is done waiting for the LED string
+    sys.setswitchinterval(1e-3)
     #button_handlers(to_led_driver)
     # handle SIGTERM, the default signal sent by kill(1)
     signal.signal(signal.SIGTERM, graceful_exit)
     while True:
+        frames = None
+        t = time.perf_counter()
         try:
             is_rendering = len(strings) and strings[0].effect
-            if not is_rendering or (is_rendering and not to_led_driver.empty()):
-                action, arg = to_led_driver.get()
-                if action == '/get':
-                    do_get(to_web_server, strings, arg)
-                elif action == '/initial_setup':
-                    do_initial_setup(strings, arg)
-                elif action == '/button':
-                    do_button(strings, arg)
-                else:
-                    raise Exception(f'unknown action {action}')
+            # checking for pending messages costs no syscall, see
+            # ControlChannel in ledthemfight.py
+            if not is_rendering or to_led_driver.pending():
+                for msg in to_led_driver.get():
+                    do_msg(to_web_server, strings, msg)
+                publish_status(status, strings, now=True)
+                if is_rendering:
+                    stats.add('ipc', time.perf_counter() - t)
                 continue
-            render_one_frame(strings)
+            stats.add('ipc', time.perf_counter() - t)
+            # render the next frame while the transmitter is still sending
+            # the previous one, then hand it over at the frame deadline
+            t = time.perf_counter()
+            frames = render_frames(strings)
+            governor.update(time.perf_counter() - t, target_fps(strings))
             check_edits(strings, to_led_driver)
+            publish_status(status, strings)
         except KeyboardInterrupt:
             # handle Ctrl-C
             graceful_exit(None, None)
         except Exception:
             err(f'exception:\n' +
                 ''.join(traceback.format_exception(*sys.exc_info())))
-        wait_next_frame()
+        t = time.perf_counter()
+        skip = scheduler.wait(target_fps(strings))
+        t2 = time.perf_counter()
+        stats.add('sleep', t2 - t)
+        if frames:
+            transmitter.submit(frames)
+            stats.add('submit', time.perf_counter() - t2)
+        for st in strings:
+            st.advance(skip)
+
+#
+# Sharded rendering
+#
+
+def shm_attach(name):
+    try:
+        # the process creating the shared memory is responsible for unlinking
+        # it, so do not let the resource tracker of this process do it
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument, and registers the shared memory
+        # again with the resource tracker, which does nothing: the tracker is
+        # shared by all the processes as it is started by the main process
+        # before forking them (see main() in ledthemfight.py). It must not be
+        # unregistered here, which would cancel the registration of the led
+        # driver.
+        return shared_memory.SharedMemory(name=name)
+
+class ShardedRenderer:
+    # Renders an effect module declaring PURE = True, meaning its render()
+    # only depends on (index, frame) and t, and on what its before_frame()
+    # computes from them, on several CPU cores. The pixels are split in contiguous
+    # shards, each rendered by one of the persistent render_shard processes
+    # (see shard_forever()) running its own instance of the module and writing
+    # packed colors straight into a shared memory frame buffer. Only the pixels
+    # coarse_pixels(num_pixels, step) are rendered.
+    def __init__(self, conns, num_pixels, effect, step=1):
+        self.conns = conns
+        self.step = step
+        self.n = len(coarse_pixels(num_pixels, step))
+        self.shm = shared_memory.SharedMemory(create=True, size=4 * self.n)
+        k = len(conns)
+        bounds = [self.n * i // k for i in range(k + 1)]
+        for conn, lo, hi in zip(conns, bounds, bounds[1:]):
+            conn.send(('load', effect, num_pixels, lo, hi, self.shm.name,
+                step))
+        try:
+            self.wait()
+        except Exception:
+            self.close()
+            raise
+
+    def wait(self):
+        errors = [e for e in [conn.recv() for conn in self.conns] if e]
+        if errors:
+            raise Exception(f'render_shard: {errors[0]}')
+
+    def render(self, frame, t, brightness):
+        # Returns the frame of packed colors, an array('I')
+        for conn in self.conns:
+            conn.send(('render', frame, t, brightness))
+        self.wait()
+        buf = array.array('I')
+        buf.frombytes(self.shm.buf[:4 * self.n])
+        return buf
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def shard_forever(conn):
+    # Entry point of a render_shard process: renders a range of pixels of the
+    # frames requested by the ShardedRenderer of the led driver
+    global proc_name
+    proc_name = 'render_shard'
+    # ignore Ctrl-C; the process exits when the led driver goes away
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shm = buf = None
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        try:
+            if msg[0] == 'load':
+                _, effect, num_pixels, lo, hi, shm_name, step = msg
+                if shm:
+                    buf.release()
+                    shm.close()
+                    shm = None
+                m = fx_load(num_pixels, effect)
+                if m is None:
+                    raise Exception(f'failed to load effect {effect}')
+                shm = shm_attach(shm_name)
+                buf = shm.buf.cast('I')
+                conv = ColorConverter(2.2, brightness)
+                cache = ColorCache(conv)
+                pixels = coarse_pixels(num_pixels, step)[lo:hi]
+            elif msg[0] == 'render':
+                _, frame, t, b = msg
+                if b != conv.brightness:
+                    conv.set_brightness(b)
+                    cache.clear()
+                set_time(m, t)
+                if hasattr(m, 'before_frame'):
+                    m.before_frame(frame)
+                render = m.render
+                buf[lo:hi] = array.array('I', cache.pack_frame(
+                    [render(i, frame) for i in pixels]))
+            conn.send(None)
+        except Exception:
+            conn.send(''.join(traceback.format_exception(*sys.exc_info())))
+
+#
+# Compiled shows
+#
+# A compiled show is an effect pre-rendered for a given LED string length,
+# fps, brightness and gamma, so playing it only means streaming bytes to the
+# LED string. File format, little-endian:
+# - header, see show_header:
+#   magic "LTFS", version (1), flags (0), number of pixels, fps, number of
+#   frames, gamma (float), brightness
+# - index: number of frames + 1 offsets (uint64) from the start of the file;
+#   frame i is stored from offset i to offset i + 1
+# - frames: packed colors 0x00RRGGBB (uint32) of all the pixels, compressed
+#   with zlib unless it does not make the frame smaller: a frame is compressed
+#   if and only if it is not 4 * number of pixels bytes long
+#
+
+show_header = struct.Struct('<4sHHIIIfI')
+show_version = 1
+
+def compile_show(fname, mod_name, num_pixels, fps, n_frames, brightness, ɣ,
+        compress=True):
+    if fps < 1 or n_frames < 1:
+        raise Exception(f'a show needs at least 1 frame at 1 fps or more, not '
+                        f'{n_frames} frames at {fps} fps')
+    m = fx_load(num_pixels, mod_name)
+    if m is None:
+        raise Exception(f'failed to load effect {mod_name}')
+    conv = ColorConverter(ɣ, brightness)
+    cache = ColorCache(conv)
+    out = [colors['black']] * num_pixels
+    index = array.array('Q')
+    with open(fname, 'wb') as f:
+        f.write(show_header.pack(b'LTFS', show_version, 0, num_pixels, fps,
+            n_frames, ɣ, brightness))
+        # the index is written once all the frames are
+        f.seek(8 * (n_frames + 1), os.SEEK_CUR)
+        for frame in range(n_frames):
+            index.append(f.tell())
+            cols = render_colors(m, num_pixels, frame, out, t=frame / fps)
+            if is_array(cols):
+                buf = conv.pack_array(cols).astype('<u4').tobytes()
+            else:
+                a = array.array('I', cache.pack_frame(cols))
+                if sys.byteorder == 'big':
+                    a.byteswap()
+                buf = a.tobytes()
+            if compress:
+                z = zlib.compress(buf)
+                if len(z) < len(buf):
+                    buf = z
+            f.write(buf)
+        index.append(f.tell())
+        f.seek(show_header.size)
+        if sys.byteorder == 'big':
+            index.byteswap()
+        f.write(index.tobytes())
+
+class ShowPlayer:
+    # Plays a compiled show by streaming it from the file mapped in memory.
+    # To bound the resident memory, pages of frames already played are
+    # released every release_bytes.
+    release_bytes = 4 << 20
+
+    def __init__(self, fname):
+        self.f = open(fname, 'rb')
+        try:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.f.close()
+            raise
+        try:
+            (magic, version, flags, self.num_pixels, self.fps, self.n_frames,
+                self.ɣ, self.brightness) = show_header.unpack_from(self.mm)
+            if magic != b'LTFS' or version != show_version:
+                raise Exception(f'{fname}: not a compiled show (version '
+                                f'{show_version})')
+            if self.fps < 1 or self.n_frames < 1:
+                raise Exception(f'{fname}: invalid show of {self.n_frames} '
+                                f'frames at {self.fps} fps')
+        except Exception:
+            self.close()
+            raise
+        self.index = array.array('Q')
+        self.index.frombytes(self.mm[show_header.size:
+            show_header.size + 8 * (self.n_frames + 1)])
+        if sys.byteorder == 'big':
+            self.index.byteswap()
+        self.mm.madvise(mmap.MADV_SEQUENTIAL)
+        self.released = 0
+
+    def frame(self, i):
+        # Returns frame i, looping over the show, as an array('I')
+        i %= self.n_frames
+        start, end = self.index[i], self.index[i + 1]
+        buf = self.mm[start:end]
+        if len(buf) != 4 * self.num_pixels:
+            buf = zlib.decompress(buf)
+        a = array.array('I')
+        a.frombytes(buf)
+        if sys.byteorder == 'big':
+            a.byteswap()
+        if end - self.released > self.release_bytes or end < self.released:
+            # madvise() offsets must be multiples of the page size
+            start = start // mmap.PAGESIZE * mmap.PAGESIZE
+            self.mm.madvise(mmap.MADV_DONTNEED, 0, start)
+            self.released = start
+        return a
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+#
+# Profiling
+#
+
+def profile_effect(mod_name, num_pixels, n_frames, seconds=None, top=30):
+    # Renders n_frames of an effect like the led driver does, minus sending
+    # them to a LED string, under cProfile, stopping early after the given
+    # number of seconds. Returns the top functions by cumulative time.
+    m = fx_load(num_pixels, mod_name)
+    if m is None:
+        raise Exception(f'failed to load effect {mod_name}')
+    conv = ColorConverter(2.2, brightness)
+    cache = ColorCache(conv)
+    out = [colors['black']] * num_pixels
+    prof = cProfile.Profile()
+    t = time.perf_counter()
+    end = t + seconds if seconds else None
+    prof.enable()
+    frame = 0
+    while frame < n_frames and (end is None or time.perf_counter() < end):
+        cols = render_colors(m, num_pixels, frame, out)
+        if is_array(cols):
+            conv.pack_array(cols)
+        else:
+            cache.pack_frame(cols)
+        frame += 1
+    prof.disable()
+    t = time.perf_counter() - t
+    ps = pstats.Stats(prof).sort_stats('cumulative')
+    funcs = []
+    for f in ps.fcn_list[:top]:
+        cc, nc, tt, ct, callers = ps.stats[f]
+        fname, line, name = f
+        funcs.append({
+            # built-in functions have no file name
+            'function': name if fname == '~' else
+                f'{os.path.basename(fname)}:{line}({name})',
+            'calls': nc,
+            'tottime': tt,
+            'cumtime': ct,
+            })
+    return {
+        'effect': mod_name,
+        'num_pixels': num_pixels,
+        'brightness': brightness,
+        # frames profiled, fewer than requested if out of time
+        'frames': frame,
+        'frames_requested': n_frames,
+        'seconds': t,
+        # slowed down by the profiler
+        'fps': frame / t,
+        'functions': funcs,
+        }
 
 #
 # Sequence generator
@@ -306,25 +1551,40 @@ def drive_led_forever(to_led_driver, to_web_server):
 
 def render(num_pixels, frame_count, m):
     frames = []
+    out = [colors['black']] * num_pixels
+    to8b = colorconv.to8b
     for frame in range(frame_count):
-        pixels = []
-        if hasattr(m, 'before_frame'):
-            m.before_frame(frame)
-        for i in range(num_pixels):
-            # pass 1.0 as the 2nd arg of cto8b() in order to disable gamma
-            # correction, because sequences are rendered in a browser shown
-            # on a display device that already performs gamma correction
-            pixels.append(cto8b(m.render(i, frame), 1.0))
-        frames.append(pixels)
+        cols = render_colors(m, num_pixels, frame, out)
+        if is_array(cols):
+            frames.append(colorconv.to8b_array(cols))
+        else:
+            frames.append([to8b(c) for c in cols])
     return frames
 
+# Sequence files, shown as previews by the web interface (see decodeSequence()
+# in www/main.js). File format, little-endian:
+# - header, see seq_header:
+#   magic "LTFP", version (1), number of pixels, fps, number of frames
+# - the RGB colors (3 bytes) of all the pixels of all the frames, each frame
+#   XORed with the previous one, so the many pixels that do not change from
+#   a frame to the next one are zeroes, compressed with zlib
+# The web interface also supports the former format: the raw RGB colors.
+seq_header = struct.Struct('<4sHHHH')
+seq_version = 1
+
 def write_bin(fname, num_pixels, n_sec, frames):
-    buf = b''
-    for fr in frames:
-        for i in fr:
-            r, g, b = i
-            buf += struct.pack('BBB', r, g, b)
-    open(fname, 'wb').write(buf)
+    if np is not None:
+        a = np.array(frames, dtype=np.uint8).reshape(len(frames), -1)
+        a[1:] ^= a[:-1].copy()
+        buf = a.tobytes()
+    else:
+        fb = [bytes(x for c in fr for x in c) for fr in frames]
+        n = 3 * num_pixels
+        buf = b''.join([fb[0]] + [(int.from_bytes(fb[i], 'little') ^
+            int.from_bytes(fb[i - 1], 'little')).to_bytes(n, 'little')
+            for i in range(1, len(fb))])
+    open(fname, 'wb').write(seq_header.pack(b'LTFP', seq_version, num_pixels,
+        round(len(frames) / n_sec), len(frames)) + zlib.compress(buf, 9))
 
 def regenerate(mod_name):
     try:
@@ -341,11 +1601,14 @@ def regenerate(mod_name):
             ''.join(traceback.format_exception(*sys.exc_info())))
 
 def seqgen_forever():
-    global brightness, proc_name
+    global brightness, proc_name, colorconv
     proc_name = 'seqgen'
     # We set brightness to a bit below 0xff so that effects that sparkle even
     # brighter (eg. the stars in Flag_US) can still be barely visible
     brightness = 0xe0
+    # ɣ=1.0 disables gamma correction, because sequences are rendered in a
+    # browser shown on a display device that already performs gamma correction
+    colorconv = ColorConverter(1.0, brightness)
     while True:
         try:
             for fname in os.listdir(pkg_path):
@@ -1,6 +1,12 @@
 var n_pixels = 60;
 var n_sec = 10;
 var sequences = {};
+// versions of the sequences generated by the seqgen (see "sequences" in
+// /get/state) and of the ones fetched, by effect name
+var seq_versions = {};
+var fetched_versions = {};
+// effects whose preview has been scrolled into view
+var visible = {};
 
 function get(url, handler, is_binary) {
     var req = new XMLHttpRequest();
@@ -48,22 +54,87 @@ function drawCanvas() {
     $("canvas").each(drawCanvasOne);
 }
 
-function initCanvasOne(index, canvas) {
-    canvas.width = n_pixels;
-    canvas.height = 1;
-    name = canvas.id.substr(4);
-    get("/sequence/" + name + ".bin", function() {
-	if (this.status == 200)
-	    sequences[canvas.id] = { seq: new Uint8Array(this.response), frame: 0 };
-	else
-	    // the first time LED Them Fight is launched, it takes some time to generate
-	    // all the sequences, so we retry to fetch the sequence until it is available
-	    setTimeout(function() { initCanvasOne(index, canvas) }, 1000);
+// Decode a sequence file, see write_bin() in worker_led.py, and call handler
+// with the RGB colors of all the pixels of all the frames and the number of
+// pixels. Files in the former format are the raw RGB colors of 60 pixels.
+function decodeSequence(buf, handler) {
+    const magic = String.fromCharCode.apply(null,
+	new Uint8Array(buf, 0, Math.min(4, buf.byteLength)));
+    if (magic != "LTFP") {
+	handler(new Uint8Array(buf), n_pixels);
+	return;
+    }
+    const hdr = new DataView(buf);
+    if (hdr.getUint16(4, true) != 1) {
+	console.log("unsupported sequence file version " + hdr.getUint16(4, true));
+	return;
+    }
+    const pixels = hdr.getUint16(6, true);
+    const stream = new Blob([buf.slice(12)]).stream()
+	.pipeThrough(new DecompressionStream("deflate"));
+    new Response(stream).arrayBuffer().then(function(raw) {
+	// each frame is XORed with the previous one
+	const seq = new Uint8Array(raw);
+	for (var i = 3 * pixels; i < seq.length; i++)
+	    seq[i] ^= seq[i - 3 * pixels];
+	handler(seq, pixels);
+    });
+}
+
+function fetchPreviews() {
+    // fetch, in one request, the previews of the visible effects which were
+    // generated or changed since they were fetched
+    const names = Object.keys(visible).filter((fx) =>
+	fx in seq_versions && seq_versions[fx] != fetched_versions[fx]);
+    if (!names.length)
+	return;
+    names.forEach((fx) => { fetched_versions[fx] = seq_versions[fx]; });
+    get("/previews?effects=" + names.map(encodeURIComponent).join(","), function() {
+	if (this.status != 200) {
+	    // try again at the next status update
+	    names.forEach((fx) => { delete fetched_versions[fx]; });
+	    return;
+	}
+	// see send_previews() in ledthemfight.py
+	const buf = this.response;
+	const view = new DataView(buf);
+	var off = 0;
+	while (off < buf.byteLength) {
+	    const len = view.getUint8(off);
+	    const name = new TextDecoder().decode(new Uint8Array(buf, off + 1, len));
+	    const size = view.getUint32(off + 1 + len, true);
+	    off += 5 + len;
+	    decodeSequence(buf.slice(off, off + size), function(seq, pixels) {
+		const canvas = document.getElementById("can_" + name);
+		canvas.width = pixels;
+		sequences[canvas.id] = { seq: seq, frame: 0 };
+	    });
+	    off += size;
+	}
     }, true);
 }
 
 function initCanvas() {
-    $("canvas").each(initCanvasOne);
+    $("canvas").each(function(index, canvas) {
+	canvas.width = n_pixels;
+	canvas.height = 1;
+    });
+    if (!("IntersectionObserver" in window)) {
+	$("canvas").each((index, canvas) => { visible[canvas.id.substr(4)] = true; });
+	fetchPreviews();
+	return;
+    }
+    // only fetch the previews of the effects scrolled into view
+    const observer = new IntersectionObserver(function(entries) {
+	entries.forEach(function(e) {
+	    if (e.isIntersecting) {
+		visible[e.target.id.substr(4)] = true;
+		observer.unobserve(e.target);
+	    }
+	});
+	fetchPreviews();
+    });
+    $("canvas").each((index, canvas) => observer.observe(canvas));
 }
 
 function status_update() {
@@ -71,6 +142,29 @@ function status_update() {
 	resp = JSON.parse(this.responseText);
 	$("#brightness").val(resp["brightness"]);
 	$("#status").html(resp["fps"] ? ("fps: " + resp["fps"].toFixed(1)) : "");
+	// the first time LED Them Fight is launched, it takes some time to
+	// generate all the sequences, and they are regenerated when effects
+	// are edited: fetch the new ones
+	seq_versions = resp["sequences"];
+	fetchPreviews();
+    });
+}
+
+function stats_update() {
+    // only poll the timings of the hot path while the panel is open
+    if (!$("#stats_panel").prop("open"))
+	return;
+    get("/get/stats", function() {
+	resp = JSON.parse(this.responseText);
+	const ms = (x) => "<td>" + x.toFixed(2) + "</td>";
+	$("#stats").html("<tr><th>stage (ms)</th><th>p50</th><th>p95</th>" +
+	    "<th>p99</th><th>max</th></tr>" +
+	    Object.entries(resp["stages"]).map(([name, s]) =>
+		"<tr><td>" + name + "</td>" + ms(s["p50"]) + ms(s["p95"]) +
+		ms(s["p99"]) + ms(s["max"]) + "</tr>").join(""));
+	$("#stats_counts").html("missed deadlines: " + resp["missed_deadlines"] +
+	    ", skipped renders: " + resp["skipped_renders"] +
+	    ", skipped shows: " + resp["skipped_shows"]);
     });
 }
 
@@ -88,6 +182,7 @@ get("/get/state", function() {
     sel = (resp["rendering"][0] == undefined) ? "#stop" : ("#" + resp["rendering"][0]);
     $(sel).prop("checked", true);
     $("#effects input").on("click", effect);
+    seq_versions = resp["sequences"];
     initCanvas();
     // render at 60 fps to match the fps we aim at on the physical LED string
     setInterval(drawCanvas, 1000 / 60);
@@ -95,3 +190,4 @@ get("/get/state", function() {
 $("#brightness").on("input", button);
 $("#pseudo_effects input").on("click", button);
 setInterval(status_update, 500);
+setInterval(stats_update, 1000);